@@ -0,0 +1,6 @@
+# benchmarks/conftest.py
+import os
+import sys
+
+# Make the src/ packages importable, as src/backend/main.py does at runtime
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
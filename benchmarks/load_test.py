@@ -0,0 +1,411 @@
+# benchmarks/load_test.py
+# Load test and latency benchmark for the backend API.
+#
+# By default the FastAPI app is started in-process under uvicorn with the
+# offline fake LLM provider, so no network or API key is needed:
+#
+#   python benchmarks/load_test.py --concurrency 32 --requests 500 --latency 0.5
+#
+# Use --url to drive an already running backend instead (event-loop lag is
+# only measured in-process). Results are written to benchmarks/results/ and
+# compared with the previous run that used the same settings.
+#
+# To see the cost of prompt input, give the fake provider a prefill cost and
+# compare runs with and without the split. The fake only caches system
+# instructions of at least --min-cache-tokens (default 1024, Gemini's minimum);
+# the current templates are shorter, so neither run reads from its cache:
+#
+#   python benchmarks/load_test.py --prefill-tokens-per-second 500
+#   python benchmarks/load_test.py --prefill-tokens-per-second 500 --no-prompt-split
+#
+# For realistic content and timing, record a run against the real provider
+# once (needs GOOGLE_API_KEY), then replay it offline as often as needed:
+#
+#   python benchmarks/load_test.py --requests 50 --cassette gemini.sqlite3 --cassette-mode record
+#   python benchmarks/load_test.py --requests 50 --cassette gemini.sqlite3 --latency-scale 0.5
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+QUIZ_TOPICS = ["DBMS", "OS", "CN", "AI", "ML", "DL", "System Design", "GenAI"]
+QUIZ_DIFFICULTIES = ["Beginner", "Intermediate", "Advanced"]
+STYLES = ["in_depth", "visual", "hands_on"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the Agentic AI Tutor backend")
+    parser.add_argument("--url", help="Base URL of a running backend (default: start one in-process)")
+    parser.add_argument("--endpoint", choices=["response", "quiz", "mixed"], default="mixed",
+                        help="Which endpoint to drive (mixed alternates both)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--num-questions", type=int, default=5, help="Questions per quiz request")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="Number of distinct payloads to cycle through (0 = every request unique)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM latency in seconds (in-process only)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0,
+                        help="Fake LLM token rate (in-process only)")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Fake LLM failure probability (in-process only)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Fake LLM input processing rate; uncached prompt tokens add latency (in-process only)")
+    parser.add_argument("--min-cache-tokens", type=int, default=1024,
+                        help="Smallest system instruction the fake LLM caches, in tokens (in-process only)")
+    parser.add_argument("--no-prompt-split", action="store_true",
+                        help="Send each prompt as one message instead of a system instruction "
+                             "plus the rest of the prompt (in-process only)")
+    parser.add_argument("--cassette", help="LLM cassette file to replay, or to record into (in-process only)")
+    parser.add_argument("--cassette-mode", choices=["record", "replay"], default="replay",
+                        help="record calls to the real LLM_PROVIDER (default gemini) into --cassette, "
+                             "or replay them from it")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier for replayed call timings (0 = no delay)")
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="Leave the response cache, semantic cache and quiz bank as configured (in-process only)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file")
+    parser.add_argument("--regression-threshold", type=float, default=0.10,
+                        help="Relative slowdown versus the previous run reported as a regression")
+    return parser.parse_args()
+
+
+def configure_fake_environment(args):
+    """
+    Point the engine at the fake provider before the app is imported
+    """
+    if args.cassette:
+        os.environ["LLM_CASSETTE_MODE"] = args.cassette_mode
+        os.environ["LLM_CASSETTE_PATH"] = os.path.abspath(args.cassette)
+        os.environ["LLM_CASSETTE_LATENCY_SCALE"] = str(args.latency_scale)
+    if not (args.cassette and args.cassette_mode == "record"):
+        os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["FAKE_LLM_PREFILL_TOKENS_PER_SECOND"] = str(args.prefill_tokens_per_second)
+    os.environ["FAKE_LLM_MIN_CACHE_TOKENS"] = str(args.min_cache_tokens)
+    os.environ["PROMPT_SYSTEM_SPLIT"] = "false" if args.no_prompt_split else "true"
+    os.environ["ENGINE_WARMUP"] = "false"
+    if not args.keep_caches:
+        os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+        os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+        os.environ["QUIZ_BANK_ENABLED"] = "false"
+
+
+class InProcessServer:
+    """
+    Runs the backend under uvicorn on its own event loop thread and probes that loop's lag
+    """
+
+    def __init__(self, probe_interval: float = 0.01):
+        import uvicorn
+
+        sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+        from backend.main import app
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.loop = asyncio.new_event_loop()
+        self.probe_interval = probe_interval
+        self.lag_samples = []
+        self._probing = False
+        self._thread = threading.Thread(target=self._run, name="uvicorn", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    async def _probe(self):
+        # Sleep for a fixed interval and record how late the loop wakes us up
+        while self._probing:
+            start = time.perf_counter()
+            await asyncio.sleep(self.probe_interval)
+            self.lag_samples.append(time.perf_counter() - start - self.probe_interval)
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def start_probe(self):
+        self._probing = True
+        asyncio.run_coroutine_threadsafe(self._probe(), self.loop)
+
+    def stop(self):
+        self._probing = False
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def build_payloads(args) -> list[tuple[str, dict]]:
+    """
+    Build the (path, body) sequence to send
+    """
+    rng = random.Random(0)
+    payloads = []
+    for index in range(args.requests):
+        variant = index % args.distinct if args.distinct else index
+        use_quiz = args.endpoint == "quiz" or (args.endpoint == "mixed" and index % 2)
+        if use_quiz:
+            payloads.append(("/generate_quiz", {
+                "topic": f"{QUIZ_TOPICS[variant % len(QUIZ_TOPICS)]} #{variant}",
+                "difficulty": QUIZ_DIFFICULTIES[variant % len(QUIZ_DIFFICULTIES)],
+                "num_questions": args.num_questions,
+            }))
+        else:
+            payloads.append(("/generate_response", {
+                "query": f"Explain concept number {variant} in computer science",
+                "style": STYLES[variant % len(STYLES)],
+            }))
+    rng.shuffle(payloads)
+    return payloads
+
+
+def run_load(base_url: str, payloads: list[tuple[str, dict]], concurrency: int, timeout: float):
+    """
+    Send the payloads from `concurrency` client threads; return per-request records and wall time
+    """
+    local = threading.local()
+
+    def send(item):
+        path, body = item
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = local.session.post(base_url + path, json=body, timeout=timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return {"path": path, "status": status, "latency": time.perf_counter() - start}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(send, payloads))
+    return records, time.perf_counter() - started
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """
+    Percentiles in milliseconds plus a bucketed histogram
+    """
+    ms = [value * 1000 for value in latencies]
+    histogram = {}
+    for bound in HISTOGRAM_BUCKETS_MS:
+        label = f"<={bound:g}ms" if bound != float("inf") else "+Inf"
+        histogram[label] = sum(1 for value in ms if value <= bound)
+    return {
+        "count": len(ms),
+        "mean_ms": statistics.fmean(ms) if ms else 0.0,
+        "p50_ms": percentile(ms, 0.50),
+        "p95_ms": percentile(ms, 0.95),
+        "p99_ms": percentile(ms, 0.99),
+        "max_ms": max(ms) if ms else 0.0,
+        "histogram_cumulative": histogram,
+    }
+
+
+def summarize(args, records, wall_time, lag_samples) -> dict:
+    ok = [r for r in records if r["status"] == 200]
+    by_path = {}
+    for path in sorted({r["path"] for r in records}):
+        by_path[path] = latency_summary([r["latency"] for r in ok if r["path"] == path])
+    errors = {}
+    for r in records:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    result = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "label": args.label,
+        "config": {
+            "target": "external" if args.url else "in_process",
+            "endpoint": args.endpoint,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "num_questions": args.num_questions,
+            "distinct": args.distinct,
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "failure_rate": args.failure_rate,
+            "keep_caches": args.keep_caches,
+            "prefill_tokens_per_second": args.prefill_tokens_per_second,
+            "min_cache_tokens": args.min_cache_tokens,
+            "prompt_split": not args.no_prompt_split,
+            "cassette": os.path.basename(args.cassette) if args.cassette else None,
+            "cassette_mode": args.cassette_mode if args.cassette else None,
+            "latency_scale": args.latency_scale,
+        },
+        "wall_time_s": wall_time,
+        "requests_per_second": len(records) / wall_time if wall_time else 0.0,
+        "success": len(ok),
+        "errors": errors,
+        "latency": latency_summary([r["latency"] for r in ok]),
+        "latency_by_endpoint": by_path,
+    }
+    if lag_samples is not None:
+        lag_ms = [value * 1000 for value in lag_samples]
+        result["event_loop_lag"] = {
+            "samples": len(lag_ms),
+            "p50_ms": percentile(lag_ms, 0.50),
+            "p99_ms": percentile(lag_ms, 0.99),
+            "max_ms": max(lag_ms) if lag_ms else 0.0,
+        }
+    return result
+
+
+def token_summary(base_url: str):
+    """
+    Upstream input tokens from the backend's /metrics, and how many were served from the provider's cache
+    """
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return None
+    totals = {}
+    for line in text.splitlines():
+        if line.startswith("ai_tutor_llm_tokens_total{"):
+            labels, value = line.rsplit(" ", 1)
+            direction = labels.split('direction="', 1)[1].split('"', 1)[0]
+            totals[direction] = totals.get(direction, 0) + float(value)
+    input_tokens = totals.get("input", 0)
+    cached = totals.get("cached_input", 0)
+    return {
+        "input": input_tokens,
+        "cached_input": cached,
+        "output": totals.get("output", 0),
+        "cached_share": cached / input_tokens if input_tokens else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(config: dict):
+    """
+    Most recent stored result with the same configuration, if any
+    """
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    for name in sorted(os.listdir(RESULTS_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(RESULTS_DIR, name), encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("config") == config:
+            return stored
+    return None
+
+
+def save_result(result: dict) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{result['git_commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def print_report(result: dict, previous, threshold: float):
+    latency = result["latency"]
+    print(f"\nRequests: {result['success']} ok, errors: {result['errors'] or 'none'}")
+    print(f"Throughput: {result['requests_per_second']:.1f} req/s over {result['wall_time_s']:.2f} s")
+    print(f"Latency: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+    for path, summary in result["latency_by_endpoint"].items():
+        print(f"  {path}: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms")
+    print("Latency histogram (cumulative):")
+    for label, count in latency["histogram_cumulative"].items():
+        print(f"  {label:>10} {count}")
+    if "event_loop_lag" in result:
+        lag = result["event_loop_lag"]
+        print(f"Event loop lag: p50 {lag['p50_ms']:.2f} ms, p99 {lag['p99_ms']:.2f} ms, max {lag['max_ms']:.2f} ms")
+    if result.get("tokens"):
+        tokens = result["tokens"]
+        print(f"Upstream tokens: {tokens['input']:.0f} input ({tokens['cached_input']:.0f} cached, "
+              f"{tokens['cached_share']:.1%}), {tokens['output']:.0f} output")
+
+    if previous is None:
+        print("\nNo previous run with the same settings to compare against")
+        return
+    print(f"\nCompared with {previous['git_commit']} ({previous['timestamp']}):")
+    checks = [
+        ("throughput", previous["requests_per_second"], result["requests_per_second"], True),
+        ("p50", previous["latency"]["p50_ms"], latency["p50_ms"], False),
+        ("p95", previous["latency"]["p95_ms"], latency["p95_ms"], False),
+        ("p99", previous["latency"]["p99_ms"], latency["p99_ms"], False),
+    ]
+    for name, before, after, higher_is_better in checks:
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        print(f"  {name:>10}: {before:.1f} -> {after:.1f} ({change:+.1%}){flag}")
+
+
+def main():
+    args = parse_args()
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        configure_fake_environment(args)
+        server = InProcessServer()
+        server.start()
+        base_url = server.url
+
+    payloads = build_payloads(args)
+    print(f"Sending {len(payloads)} requests to {base_url} with concurrency {args.concurrency}...")
+    try:
+        if server is not None:
+            server.start_probe()
+        records, wall_time = run_load(base_url, payloads, args.concurrency, args.timeout)
+        tokens = token_summary(base_url)
+    finally:
+        if server is not None:
+            server.stop()
+
+    result = summarize(args, records, wall_time, server.lag_samples if server is not None else None)
+    result["tokens"] = tokens
+    previous = previous_result(result["config"])
+    print_report(result, previous, args.regression_threshold)
+    if not args.no_save:
+        print(f"\nResults written to {save_result(result)}")
+
+
+if __name__ == "__main__":
+    main()
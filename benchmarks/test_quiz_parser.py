@@ -0,0 +1,63 @@
+# benchmarks/test_quiz_parser.py
+# Accuracy and throughput of the quiz parser on recorded LLM quiz outputs.
+#
+#   python -m pytest benchmarks/test_quiz_parser.py --benchmark-only
+#
+# The throughput benchmarks need pytest-benchmark and are skipped without it.
+
+import json
+import os
+
+import pytest
+
+from ai_engine.quiz_parser import parse_quiz
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_corpus")
+
+with open(os.path.join(CORPUS_DIR, "expected.json"), encoding="utf-8") as f:
+    EXPECTED = json.load(f)
+
+
+def _load(name: str) -> str:
+    with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+CORPUS = {name: _load(name) for name in sorted(EXPECTED)}
+
+
+def _accuracy(parsed: list[dict], expected: list[dict]) -> float:
+    """Fraction of expected questions reproduced exactly, in order"""
+    matched = sum(1 for got, want in zip(parsed, expected) if got == want)
+    return matched / max(len(expected), len(parsed))
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_parse_accuracy(name):
+    parsed = [question.to_dict() for question in parse_quiz(CORPUS[name])]
+    assert _accuracy(parsed, EXPECTED[name]) == 1.0
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_parse_throughput_per_format(request, name):
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    content = CORPUS[name]
+    result = benchmark(parse_quiz, content)
+    benchmark.extra_info["questions"] = len(result)
+    benchmark.extra_info["bytes"] = len(content)
+
+
+def test_parse_throughput_whole_corpus(request):
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    documents = list(CORPUS.values()) * 50
+
+    def parse_all():
+        return sum(len(parse_quiz(document)) for document in documents)
+
+    total = benchmark(parse_all)
+    benchmark.extra_info["questions_per_round"] = total
+    benchmark.extra_info["accuracy"] = sum(
+        _accuracy([q.to_dict() for q in parse_quiz(CORPUS[name])], EXPECTED[name]) for name in CORPUS
+    ) / len(CORPUS)
@@ -3,8 +3,13 @@ import subprocess
 import sys
 import os
 import time
+import json
+import urllib.request
+import urllib.error
 from dotenv import load_dotenv
 
+BACKEND_READY_URL = "http://localhost:8000/ready"
+
 def run_backend():
     """Run the FastAPI backend server"""
     try:
@@ -14,14 +19,43 @@ def run_backend():
         # Copy current environment to ensure all variables are passed through
         env = os.environ.copy()
         
+        # Several workers share caches and the quiz bank through the local state store
+        workers = env.get("WEB_CONCURRENCY", "1")
+        drain_timeout = int(float(env.get("ENGINE_DRAIN_TIMEOUT", "30")))
         process = subprocess.Popen([
-            sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000",
+            "--workers", workers, "--timeout-graceful-shutdown", str(drain_timeout + 5),
+            # The backend writes its own sampled, structured access log
+            "--no-access-log"
         ], cwd=backend_dir, env=env)
         return process
     except Exception as e:
         print(f"Error starting backend: {e}")
         return None
 
+def wait_for_backend(process, timeout=60.0):
+    """Wait until the backend reports ready, fails to initialize, or the timeout expires"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            print("Backend server exited during startup")
+            return False
+        try:
+            with urllib.request.urlopen(BACKEND_READY_URL, timeout=2) as response:
+                print("Backend is ready")
+                return True
+        except urllib.error.HTTPError as e:
+            # 503 while the engine is initializing; stop waiting if it failed outright
+            status = json.loads(e.read() or b"{}")
+            if status.get("state") == "failed":
+                print(f"Warning: AI engine is unavailable: {status.get('error')}")
+                return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass  # Server is not accepting connections yet
+        time.sleep(0.25)
+    print(f"Warning: Backend was not ready after {timeout:.0f} seconds, starting frontend anyway")
+    return True
+
 def run_frontend():
     """Run the Streamlit frontend"""
     try:
@@ -62,8 +96,10 @@ if __name__ == "__main__":
         print("Failed to start backend server")
         sys.exit(1)
     
-    # Wait a moment for backend to start
-    time.sleep(2)
+    # Wait for the backend to report readiness instead of sleeping blindly
+    if not wait_for_backend(backend_process, timeout=float(os.getenv("BACKEND_READY_TIMEOUT", "60"))):
+        print("Failed to start backend server")
+        sys.exit(1)
     
     # Start frontend
     frontend_process = run_frontend()
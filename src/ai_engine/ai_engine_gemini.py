@@ -1,53 +1,201 @@
 # src/ai_engine/ai_engine_gemini.py
-# AI engine using Google's Gemini models
+# AI engine using Google's Gemini models (or another LLM provider, see providers.py)
 
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
-from pydantic import SecretStr
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
-import traceback
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
 
-# Initialize Gemini LLM with error handling
-api_key = os.getenv("GOOGLE_API_KEY")
-llm = None
+from .call_policy import create_call_policy
+from .cassette import RecordingProvider, ReplayProvider
+from .metrics import ERRORS, LLM_CALL_SECONDS, LLM_IN_FLIGHT, LLM_QUEUE_SECONDS, PROMPT_RENDER_SECONDS, PROMPT_TOKENS, QUIZ_PARSE_SECONDS, QUIZ_SECONDS, RESPONSE_SECONDS
+from .providers import create_provider, estimate_tokens
+from .quiz_bank import QUIZ_DIFFICULTIES, QUIZ_TOPICS, create_quiz_bank, question_key
+from .quiz_parser import parse_quiz
+from .quiz_schema import QUIZ_JSON_SCHEMA, parse_quiz_json
+from .rate_limiter import AdmissionError, create_limiter
+from .response_cache import create_response_cache, make_cache_key
+from .semantic_cache import create_semantic_cache
+from .shared_state import aclaim_once, arelease_claim, claim_once
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# The LLM provider (LLM_PROVIDER, Gemini by default) is built lazily on first
+# use (or by start_engine) so that importing this module never waits on the network
+provider = None
 initialization_error = None
+_init_lock = threading.Lock()
+_warmup_state = "not_started"  # "not_started", "running", "done", "skipped"
+_draining = False
+_in_flight_calls = 0
+
+def get_provider():
+    """
+    Return the LLM provider, constructing it on first use.
+    Raises if the provider could not be initialized.
+    """
+    global provider, initialization_error
+    if provider is None and initialization_error is None:
+        with _init_lock:
+            if provider is None and initialization_error is None:
+                try:
+                    provider = create_provider()
+                    logger.info("Initialized LLM provider", extra={"provider": provider.name})
+                except Exception as e:
+                    initialization_error = str(e)
+                    logger.warning("Failed to initialize LLM provider: %s", e)
+    if provider is None:
+        raise Exception(f"LLM provider is not available: {initialization_error}")
+    return provider
+
+async def aget_provider():
+    """
+    get_provider for the event loop: building the provider (or waiting for the
+    init thread that is building it) runs in a thread
+    """
+    if provider is not None:
+        return provider
+    return await asyncio.to_thread(get_provider)
 
-if api_key:
+def _warm_up():
+    """
+    Initialize the provider and send a small request to reduce first-request latency.
+    When several workers start together only one of them sends the request.
+    """
+    global _warmup_state
     try:
-        # Configure the Google Generative AI library
-        genai.configure(api_key=api_key)
-        
-        # Initialize the LLM with LangChain wrapper
-        # Convert api_key to string to avoid validation errors
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-pro-latest",
-            google_api_key=str(api_key),
-            temperature=0.7
-        )
-        print("Successfully initialized Gemini LLM")
-        
-        # Warm up the model with a simple request to reduce first-request latency
+        if not claim_once("engine-warmup", float(os.getenv("ENGINE_WARMUP_TTL", "300"))):
+            logger.info("Warmup already done by another worker, skipping")
+            get_provider()
+            return
+        get_provider().warm_up()
+        logger.info("Model warmed up successfully")
+    except Exception as warmup_error:
+        # Continue even if warmup fails
+        logger.warning("Model warmup failed: %s", warmup_error)
+    finally:
+        _warmup_state = "done"
+
+def start_engine(warmup: bool = None):
+    """
+    Initialize the engine without blocking the caller.
+    With warmup enabled (ENGINE_WARMUP, default true) the warmup request runs
+    in a background thread and the engine reports ready once it completes.
+    When several workers start together only one of them sends the warmup
+    request (claimed through the shared state store for ENGINE_WARMUP_TTL
+    seconds); the others just build their provider.
+    """
+    global _warmup_state
+    if warmup is None:
+        warmup = os.getenv("ENGINE_WARMUP", "true").lower() == "true"
+    if _warmup_state != "not_started":
+        return
+    if not warmup:
+        _warmup_state = "skipped"
+        threading.Thread(target=_initialize_quietly, name="llm-init", daemon=True).start()
+        return
+    _warmup_state = "running"
+    threading.Thread(target=_warm_up, name="llm-warmup", daemon=True).start()
+
+def _initialize_quietly():
+    """
+    Build the provider ahead of the first request; failures surface through engine_status
+    """
+    try:
+        get_provider()
+    except Exception:
+        pass
+
+def begin_shutdown():
+    """
+    Stop reporting ready and stop starting background work, so the worker can drain
+    """
+    global _draining
+    _draining = True
+    cancel_prefetches()
+
+async def drain(timeout: float) -> bool:
+    """
+    Wait up to timeout seconds for in-flight upstream LLM calls to finish.
+    Returns True if none are left.
+    """
+    deadline = time.monotonic() + timeout
+    while _in_flight_calls and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if _in_flight_calls:
+        logger.warning("Shutting down with %d LLM calls still in flight", _in_flight_calls)
+    return _in_flight_calls == 0
+
+def engine_status() -> dict:
+    """
+    Report engine readiness: "draining", "failed", "initializing" or "ready"
+    """
+    if _draining:
+        return {"state": "draining", "in_flight": _in_flight_calls}
+    if initialization_error is not None:
+        return {"state": "failed", "error": initialization_error}
+    if _warmup_state == "running" or provider is None:
+        return {"state": "initializing"}
+    return {"state": "ready", "provider": provider.name}
+
+# Cap on concurrent upstream LLM calls made through the async entry points
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "8"))
+
+# Admission control in front of the provider: concurrency cap, token bucket,
+# bounded queue with a deadline, and backoff when the provider returns 429
+_limiter = create_limiter(MAX_CONCURRENT_LLM_CALLS)
+
+@asynccontextmanager
+async def _upstream_slot(operation: str = "invoke"):
+    """
+    Hold one admitted upstream call slot and count the call as in flight.
+    Raises an AdmissionError subclass if the call cannot be admitted.
+    """
+    global _in_flight_calls
+    queued_at = time.perf_counter()
+    async with _limiter.slot():
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - queued_at, operation=operation)
+        _in_flight_calls += 1
         try:
-            warmup_result = llm.invoke("Hello, this is a warmup request.")
-            print("Model warmed up successfully")
-        except Exception as warmup_error:
-            print(f"Warning: Model warmup failed: {warmup_error}")
-            # Continue even if warmup fails
-    except Exception as e:
-        initialization_error = str(e)
-        print(f"Warning: Failed to initialize Gemini LLM: {e}")
-else:
-    initialization_error = "GOOGLE_API_KEY environment variable is not set"
-    print("GOOGLE_API_KEY environment variable is not set")
+            with LLM_IN_FLIGHT.track_in_progress(operation=operation), LLM_CALL_SECONDS.time(operation=operation):
+                yield
+        finally:
+            _in_flight_calls -= 1
 
-# Define prompt templates for different styles
-IN_DEPTH_PROMPT = PromptTemplate(
-    input_variables=["query"],
-    template="""
-You are an expert AI tutor. Provide a comprehensive, in-depth explanation of the following topic:
-{query}
+# Per-call timeouts, retries on transient errors and optional hedged requests
+call_policy = create_call_policy()
+
+# Identical concurrent requests wait on one in-flight upstream call
+_singleflight = SingleFlight()
+
+# Cache of generated tutor responses keyed on normalized (query, style)
+response_cache = create_response_cache()
 
+# Similarity cache consulted after an exact-match miss, for paraphrased questions
+semantic_cache = create_semantic_cache()
+
+# Bank of pre-generated quiz questions per (topic, difficulty)
+quiz_bank = create_quiz_bank()
+QUIZ_BANK_MIN_SIZE = int(os.getenv("QUIZ_BANK_MIN_SIZE", "20"))
+QUIZ_BANK_BATCH_SIZE = int(os.getenv("QUIZ_BANK_BATCH_SIZE", "5"))
+# Background refills only run for the fixed topic x difficulty grid, at most
+# once per pair every QUIZ_BANK_REFILL_INTERVAL seconds across all workers
+QUIZ_BANK_REFILL_INTERVAL = float(os.getenv("QUIZ_BANK_REFILL_INTERVAL", "300"))
+_refilling_pairs: set[tuple[str, str]] = set()
+_last_refills: dict[tuple[str, str], float] = {}
+_background_tasks: set[asyncio.Task] = set()
+
+# Define prompt templates for different styles.
+# The static instruction block of each template is also kept in
+# metadata["system_instruction"]; with PROMPT_SYSTEM_SPLIT it is sent as the
+# model's system instruction and the rest of the template as the prompt.
+_IN_DEPTH_INSTRUCTIONS = """
 Please include:
 - Detailed background information
 - Key concepts and principles
@@ -56,14 +204,17 @@ Please include:
 - Common misconceptions and clarifications
 - Relevant examples and case studies
 """
-)
 
-VISUAL_PROMPT = PromptTemplate(
+IN_DEPTH_PROMPT = PromptTemplate(
     input_variables=["query"],
     template="""
-You are an expert AI tutor. Create a visual learning experience for the following topic:
+You are an expert AI tutor. Provide a comprehensive, in-depth explanation of the following topic:
 {query}
+""" + _IN_DEPTH_INSTRUCTIONS,
+    metadata={"system_instruction": _IN_DEPTH_INSTRUCTIONS},
+)
 
+_VISUAL_INSTRUCTIONS = """
 Please provide:
 - A conceptual diagram or flowchart description
 - Visual metaphors and analogies
@@ -72,14 +223,17 @@ Please provide:
 - Suggested diagrams to draw
 - How to visualize the concept mentally
 """
-)
 
-HANDS_ON_PROMPT = PromptTemplate(
+VISUAL_PROMPT = PromptTemplate(
     input_variables=["query"],
     template="""
-You are an expert AI tutor. Create a hands-on learning experience for the following topic:
+You are an expert AI tutor. Create a visual learning experience for the following topic:
 {query}
+""" + _VISUAL_INSTRUCTIONS,
+    metadata={"system_instruction": _VISUAL_INSTRUCTIONS},
+)
 
+_HANDS_ON_INSTRUCTIONS = """
 Please provide:
 - Practical exercises and coding examples
 - Step-by-step implementation guides
@@ -88,13 +242,17 @@ Please provide:
 - Debugging tips and common errors
 - Practice problems with solutions
 """
-)
 
-QUIZ_PROMPT = PromptTemplate(
-    input_variables=["topic", "difficulty", "num_questions"],
+HANDS_ON_PROMPT = PromptTemplate(
+    input_variables=["query"],
     template="""
-Create {num_questions} multiple-choice questions about {topic} at {difficulty} level for final year computer science students preparing for placements.
+You are an expert AI tutor. Create a hands-on learning experience for the following topic:
+{query}
+""" + _HANDS_ON_INSTRUCTIONS,
+    metadata={"system_instruction": _HANDS_ON_INSTRUCTIONS},
+)
 
+_QUIZ_INSTRUCTIONS = """
 Format each question EXACTLY as follows:
 
 1. What is the primary function of an operating system?
@@ -111,162 +269,738 @@ Follow this EXACT format for all questions:
 - Options A, B, C, D on separate lines starting with the letter and a period
 - "Answer:" followed by the correct letter
 - "Explanation:" followed by a detailed explanation
+"""
 
+QUIZ_PROMPT = PromptTemplate(
+    input_variables=["topic", "difficulty", "num_questions"],
+    partial_variables={"focus": ""},
+    template="""
+Create {num_questions} multiple-choice questions about {topic} at {difficulty} level for final year computer science students preparing for placements.
+{focus}
+""" + _QUIZ_INSTRUCTIONS + """
 Ensure the questions cover key concepts, practical applications, and real-world scenarios relevant to {topic}.
+""",
+    metadata={"system_instruction": _QUIZ_INSTRUCTIONS},
+)
+
+_QUIZ_JSON_INSTRUCTIONS = """
+Respond with ONLY a JSON array, no prose and no code fences. The array must match this JSON schema:
+{schema}
+
+Rules:
+- Each question has exactly 4 options, given as plain text without "A." style labels
+- "correct_answer" is the letter (A, B, C or D) of the correct option
+- "explanation" explains why the answer is correct and why the others are not
 """
+
+QUIZ_JSON_PROMPT = PromptTemplate(
+    input_variables=["topic", "difficulty", "num_questions"],
+    partial_variables={"schema": QUIZ_JSON_SCHEMA, "focus": ""},
+    template="""
+Create {num_questions} multiple-choice questions about {topic} at {difficulty} level for final year computer science students preparing for placements.
+{focus}
+""" + _QUIZ_JSON_INSTRUCTIONS + """
+Ensure the questions cover key concepts, practical applications, and real-world scenarios relevant to {topic}.
+""",
+    metadata={"system_instruction": _QUIZ_JSON_INSTRUCTIONS.format(schema=QUIZ_JSON_SCHEMA)},
 )
 
+# With the split on (default), each template's static instruction block goes
+# out as a system instruction; off sends the whole template as one prompt
+PROMPT_SYSTEM_SPLIT = os.getenv("PROMPT_SYSTEM_SPLIT", "true").lower() == "true"
+
+# "json" asks for structured output and falls back to the text parser only when
+# no valid question can be decoded; "text" always uses the free-text format
+QUIZ_OUTPUT_MODE = os.getenv("QUIZ_OUTPUT_MODE", "json").lower()
+_quiz_parse_counts = {"json": 0, "text": 0, "text_fallback": 0}
+
+# Large quizzes are split into batches of QUIZ_CHUNK_SIZE questions generated
+# concurrently (at most QUIZ_CHUNK_FANOUT at a time), each steered to a
+# different aspect of the topic so the merged quiz has few duplicates
+QUIZ_CHUNK_THRESHOLD = int(os.getenv("QUIZ_CHUNK_THRESHOLD", "5"))
+QUIZ_CHUNK_SIZE = int(os.getenv("QUIZ_CHUNK_SIZE", "3"))
+QUIZ_CHUNK_FANOUT = int(os.getenv("QUIZ_CHUNK_FANOUT", "4"))
+QUIZ_CHUNK_ASPECTS = [
+    "core definitions and terminology",
+    "internal mechanisms and algorithms",
+    "practical applications and real-world scenarios",
+    "trade-offs, comparisons and performance",
+    "common pitfalls and misconceptions",
+    "interview-style problem solving",
+]
+
+def _select_prompt(style: str) -> PromptTemplate:
+    """
+    Return the prompt template for the requested response style
+    """
+    if style == "in_depth":
+        return IN_DEPTH_PROMPT
+    elif style == "visual":
+        return VISUAL_PROMPT
+    elif style == "hands_on":
+        return HANDS_ON_PROMPT
+    return IN_DEPTH_PROMPT  # default
+
+def _cache_style(style: str) -> str:
+    """
+    Style a response is cached under: free-form values get the in-depth prompt,
+    so they share its cache entries (and the semantic cache keeps one index per known style)
+    """
+    return style if style in ("in_depth", "visual", "hands_on") else "in_depth"
+
+def _style_label(style: str) -> str:
+    """
+    Metric label for a response style; free-form values are folded into "other"
+    """
+    return style if style in ("in_depth", "visual", "hands_on") else "other"
+
+def _quiz_labels(topic: str, difficulty: str) -> dict:
+    """
+    Metric labels for a quiz; topics and difficulties outside the fixed grid are folded into "other"
+    """
+    topics = {t.lower(): t for t in QUIZ_TOPICS}
+    difficulties = {d.lower(): d for d in QUIZ_DIFFICULTIES}
+    return {
+        "topic": topics.get(topic.strip().lower(), "other"),
+        "difficulty": difficulties.get(difficulty.strip().lower(), "other"),
+    }
+
+def _on_quiz_grid(topic: str, difficulty: str) -> bool:
+    """
+    Whether (topic, difficulty) is one of the pairs offered by the Quiz Generator page
+    """
+    return "other" not in _quiz_labels(topic, difficulty).values()
+
+def _render_prompt(name: str, template: PromptTemplate, **variables) -> tuple[Optional[str], str]:
+    """
+    Render a prompt template into (system instruction, prompt), timing it
+    under the given template name. With PROMPT_SYSTEM_SPLIT the template's
+    static instruction block is taken out of the prompt and returned as the
+    system instruction; without it the system instruction is None and the
+    prompt is the whole template. Estimated tokens of the static block and of
+    the rest of the prompt are counted per template.
+    """
+    with PROMPT_RENDER_SECONDS.time(template=name):
+        system = template.metadata["system_instruction"]
+        prompt = template.format(**variables)
+        variable = prompt.replace(system, "", 1)
+    PROMPT_TOKENS.inc(estimate_tokens(system), template=name, part="static")
+    PROMPT_TOKENS.inc(estimate_tokens(variable), template=name, part="variable")
+    if PROMPT_SYSTEM_SPLIT:
+        return system, variable
+    return None, prompt
+
+def _cached_response(query: str, style: str):
+    """
+    Return the cached response for (query, style), or None on a miss.
+    Exact matches are tried first, then similar past queries.
+    """
+    style = _cache_style(style)
+    if response_cache is not None:
+        cached = response_cache.get(query, style)
+        if cached is not None:
+            logger.info("Response cache hit", extra={"style": style, "cache": "exact"})
+            return cached
+    if semantic_cache is not None:
+        cached = semantic_cache.get(query, style)
+        if cached is not None:
+            logger.info("Response cache hit", extra={"style": style, "cache": "semantic"})
+            return cached
+    return None
+
+async def _acached_response(query: str, style: str):
+    """
+    _cached_response for the event loop: a SQLite response cache is read in a worker thread
+    """
+    style = _cache_style(style)
+    if response_cache is not None:
+        cached = await response_cache.aget(query, style)
+        if cached is not None:
+            logger.info("Response cache hit", extra={"style": style, "cache": "exact"})
+            return cached
+    if semantic_cache is not None:
+        cached = semantic_cache.get(query, style)
+        if cached is not None:
+            logger.info("Response cache hit", extra={"style": style, "cache": "semantic"})
+            return cached
+    return None
+
+def _store_response(query: str, style: str, response: str):
+    """
+    Store a freshly generated response in the caches
+    """
+    if not response:
+        return
+    style = _cache_style(style)
+    if response_cache is not None:
+        response_cache.set(query, style, response)
+    if semantic_cache is not None:
+        semantic_cache.set(query, style, response)
+
+async def _astore_response(query: str, style: str, response: str):
+    """
+    _store_response for the event loop
+    """
+    if not response:
+        return
+    style = _cache_style(style)
+    if response_cache is not None:
+        await response_cache.aset(query, style, response)
+    if semantic_cache is not None:
+        semantic_cache.set(query, style, response)
+
+def _stored_stats() -> tuple:
+    """
+    Stats of the response cache, quiz bank and cassette, which count their SQLite rows
+    """
+    return (
+        response_cache.stats() if response_cache is not None else None,
+        quiz_bank.stats() if quiz_bank is not None else None,
+        provider.stats() if isinstance(provider, (RecordingProvider, ReplayProvider)) else None,
+    )
+
+async def aget_engine_stats() -> dict:
+    """
+    Return engine counters for monitoring; the stored stats are read in a thread
+    """
+    response_cache_stats, quiz_bank_stats, cassette_stats = await asyncio.to_thread(_stored_stats)
+    return {
+        "response_cache": response_cache_stats,
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "quiz_bank": quiz_bank_stats,
+        "quiz_parsing": dict(_quiz_parse_counts),
+        "request_coalescing": _singleflight.stats(),
+        "upstream_limiter": _limiter.stats(),
+        "call_policy": call_policy.stats(),
+        "llm_cassette": cassette_stats,
+        "quiz_prefetch": {**_prefetch_counts, "running": sum(1 for _, task in _prefetches.values() if not task.done())},
+    }
+
 def generate_ai_response(query: str, style: str) -> str:
     """
     Generate AI response based on the query and preferred style using Gemini models
     """
+    cached = _cached_response(query, style)
+    if cached is not None:
+        return cached
+    
     # Check if we have a valid LLM
-    if llm is None:
-        raise Exception(f"Gemini LLM is not available: {initialization_error}")
+    llm = get_provider()
     
     try:
-        print(f"Generating AI response for query: {query[:50]}... with style: {style}")
+        logger.info("Generating AI response", extra={"style": style, "query_chars": len(query)})
         
-        # Select appropriate prompt based on style
-        if style == "in_depth":
-            prompt = IN_DEPTH_PROMPT
-        elif style == "visual":
-            prompt = VISUAL_PROMPT
-        elif style == "hands_on":
-            prompt = HANDS_ON_PROMPT
-        else:
-            prompt = IN_DEPTH_PROMPT  # default
+        # Render the prompt and run it
+        system, prompt = _render_prompt(_style_label(style), _select_prompt(style), query=query)
         
-        # Create chain and run
-        chain = prompt | llm
-        print("Invoking chain...")
+        response = call_policy.run_sync(lambda: llm.invoke(prompt, system=system))
+        logger.debug("LLM invoked successfully")
+        _store_response(query, style, response)
+        return response
+        
+    except Exception as e:
+        ERRORS.inc(stage="generate_ai_response", type=type(e).__name__)
+        logger.exception("Error in generate_ai_response")
+        raise Exception(f"Error in generate_ai_response: {str(e)}") from e
+
+async def agenerate_ai_response(query: str, style: str) -> str:
+    """
+    Async variant of generate_ai_response that does not block the event loop.
+    At most MAX_CONCURRENT_LLM_CALLS upstream calls run at once; the rest queue
+    for up to LLM_QUEUE_TIMEOUT seconds before an EngineOverloadedError.
+    Concurrent requests for the same normalized (query, style) share one upstream call.
+    """
+    started = time.perf_counter()
+    cached = await _acached_response(query, style)
+    if cached is not None:
+        RESPONSE_SECONDS.observe(time.perf_counter() - started, style=_style_label(style), source="cache")
+        return cached
+    
+    response = await _singleflight.do(
+        ("response", make_cache_key(query, style)),
+        lambda: _agenerate_response_live(query, style)
+    )
+    RESPONSE_SECONDS.observe(time.perf_counter() - started, style=_style_label(style), source="live")
+    return response
+
+async def _agenerate_response_live(query: str, style: str) -> str:
+    """
+    Generate a tutor response with a live LLM call and cache it
+    """
+    llm = await aget_provider()
+    
+    try:
+        logger.info("Generating AI response", extra={"style": style, "query_chars": len(query)})
+        
+        system, prompt = _render_prompt(_style_label(style), _select_prompt(style), query=query)
+        response = await call_policy.run(lambda: llm.ainvoke(prompt, system=system), admit=_upstream_slot)
+        logger.debug("LLM invoked successfully")
+        await _astore_response(query, style, response)
+        return response
+        
+    except AdmissionError:
+        # Rate limiting and overload are reported to the client as 429/503
+        raise
+    except Exception as e:
+        ERRORS.inc(stage="agenerate_ai_response", type=type(e).__name__)
+        logger.exception("Error in agenerate_ai_response")
+        raise Exception(f"Error in agenerate_ai_response: {str(e)}") from e
+
+async def astream_ai_response(query: str, style: str):
+    """
+    Stream the AI response for the query as text chunks while Gemini generates it.
+    The upstream concurrency slot is held until the stream finishes.
+    Concurrent identical streams share one upstream stream, and a request
+    joining it late first receives the chunks already generated. A cached
+    response, or the result of an identical non-streamed request already in
+    flight, is yielded as a single chunk.
+    """
+    started = time.perf_counter()
+    cached = await _acached_response(query, style)
+    if cached is not None:
+        RESPONSE_SECONDS.observe(time.perf_counter() - started, style=_style_label(style), source="cache")
+        yield cached
+        return
+    
+    async for text in _singleflight.stream(
+        ("response", make_cache_key(query, style)),
+        lambda: _astream_response_live(query, style),
+        combine="".join,
+    ):
+        yield text
+    RESPONSE_SECONDS.observe(time.perf_counter() - started, style=_style_label(style), source="stream")
+
+async def _astream_response_live(query: str, style: str):
+    """
+    Stream a tutor response with a live LLM call and cache it once complete
+    """
+    llm = await aget_provider()
+    
+    try:
+        logger.info("Streaming AI response", extra={"style": style, "query_chars": len(query)})
         
-        result = chain.invoke({"query": query})
-        print("Chain invoked successfully")
-        return str(result.content) if hasattr(result, 'content') else str(result)
+        system, prompt = _render_prompt(_style_label(style), _select_prompt(style), query=query)
+        chunks = []
+        async for text in call_policy.stream(lambda: llm.astream(prompt, system=system), admit=lambda: _upstream_slot("stream")):
+            chunks.append(text)
+            yield text
+        logger.debug("LLM stream finished successfully")
+        await _astore_response(query, style, "".join(chunks))
         
+    except AdmissionError:
+        raise
     except Exception as e:
-        error_msg = f"Error in generate_ai_response: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        raise Exception(error_msg)
+        ERRORS.inc(stage="astream_ai_response", type=type(e).__name__)
+        logger.exception("Error in astream_ai_response")
+        raise Exception(f"Error in astream_ai_response: {str(e)}") from e
 
 def generate_quiz(topic: str, difficulty: str, num_questions: int) -> list[dict]:
     """
     Generate quiz questions for the given topic and difficulty using Gemini models
     """
     # Check if we have a valid LLM
-    if llm is None:
-        raise Exception(f"Gemini LLM is not available: {initialization_error}")
+    llm = get_provider()
     
     try:
-        print(f"Generating quiz for topic: {topic}, difficulty: {difficulty}, questions: {num_questions}")
+        logger.info("Generating quiz", extra={"topic": topic, "difficulty": difficulty, "num_questions": num_questions})
         
-        # Create chain with quiz prompt
-        chain = QUIZ_PROMPT | llm
+        # Render the quiz prompt
+        system, prompt = _render_prompt("quiz", _quiz_prompt(), topic=topic, difficulty=difficulty, num_questions=num_questions)
         
-        # Run the chain
-        print("Invoking quiz chain...")
-        result = chain.invoke({"topic": topic, "difficulty": difficulty, "num_questions": num_questions})
-        print("Quiz chain invoked successfully")
+        # Run it
+        content = call_policy.run_sync(lambda: llm.invoke(prompt, system=system))
+        logger.debug("Quiz LLM call succeeded")
         
         # Parse the AI response into structured quiz questions
-        content = str(result.content if hasattr(result, 'content') else result)
-        
-        # Try to parse the content into structured questions
-        questions = _parse_quiz_response(content)
-        return questions
+        return _parse_quiz_output(content)
         
     except Exception as e:
-        error_msg = f"Error in generate_quiz: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        raise Exception(error_msg)
+        ERRORS.inc(stage="generate_quiz", type=type(e).__name__)
+        logger.exception("Error in generate_quiz")
+        raise Exception(f"Error in generate_quiz: {str(e)}") from e
 
-def _parse_quiz_response(content: str) -> list[dict]:
+async def agenerate_quiz(topic: str, difficulty: str, num_questions: int) -> list[dict]:
     """
-    Parse the AI-generated quiz content into structured questions.
+    Async variant of generate_quiz, bounded by the same upstream concurrency cap.
+    Questions are served from the quiz bank when it holds enough for the pair;
+    otherwise they are generated live and added to the bank. Concurrent
+    identical requests share one generation.
+    """
+    started = time.perf_counter()
+    if quiz_bank is not None:
+        banked = await asyncio.to_thread(quiz_bank.sample, topic, difficulty, num_questions)
+        if banked is not None:
+            logger.info("Serving quiz from bank", extra={"topic": topic, "difficulty": difficulty})
+            if await asyncio.to_thread(quiz_bank.count, topic, difficulty) < QUIZ_BANK_MIN_SIZE:
+                schedule_quiz_bank_refill(topic, difficulty)
+            QUIZ_SECONDS.observe(time.perf_counter() - started, source="bank", **_quiz_labels(topic, difficulty))
+            return banked
+    
+    key = ("quiz", topic.strip().lower(), difficulty.strip().lower(), num_questions)
+    questions = await _singleflight.do(key, lambda: _agenerate_quiz_uncached(topic, difficulty, num_questions))
+    QUIZ_SECONDS.observe(time.perf_counter() - started, source="live", **_quiz_labels(topic, difficulty))
+    return questions
+
+async def _agenerate_quiz_uncached(topic: str, difficulty: str, num_questions: int) -> list[dict]:
+    """
+    Generate a quiz live, chunked when large, and add it to the bank
     """
+    if num_questions > QUIZ_CHUNK_THRESHOLD:
+        questions = await agenerate_quiz_chunked(topic, difficulty, num_questions)
+    else:
+        questions = await _agenerate_quiz_live(topic, difficulty, num_questions)
+    if quiz_bank is not None:
+        await asyncio.to_thread(quiz_bank.add, topic, difficulty, questions)
+        schedule_quiz_bank_refill(topic, difficulty)
+    return questions
+
+async def _agenerate_quiz_live(topic: str, difficulty: str, num_questions: int, focus: str = "") -> list[dict]:
+    """
+    Generate quiz questions with a live LLM call
+    """
+    llm = await aget_provider()
+    
     try:
-        # Split content into lines
-        lines = content.strip().split('\n')
-        questions = []
-        current_question = None
+        logger.info("Generating quiz", extra={"topic": topic, "difficulty": difficulty, "num_questions": num_questions})
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Look for question patterns
-            if (line.startswith('Q') and ':' in line) or line.startswith('Question') or (line[0].isdigit() and ('.' in line[:3] or ':' in line[:3])):
-                if current_question:
-                    questions.append(current_question)
-                # Extract just the question text, removing the prefix
-                question_text = line
-                if ':' in line:
-                    question_text = line.split(':', 1)[1].strip()
-                elif line[0].isdigit() and ('.' in line or ':' in line):
-                    question_text = line.split('.', 1)[1].strip() if '.' in line else line.split(':', 1)[1].strip()
-                
-                current_question = {
-                    'question': question_text,
-                    'options': [],
-                    'correct_answer': '',
-                    'explanation': ''
-                }
-            elif current_question and (line.startswith('A.') or line.startswith('B.') or line.startswith('C.') or line.startswith('D.') or 
-                  line.startswith('(A)') or line.startswith('(B)') or line.startswith('(C)') or line.startswith('(D)') or
-                  (line[0].isalpha() and line[1:3] in [').', ': '])):
-                # Handle different option formats
-                option_text = line
-                if ':' in line:
-                    option_text = line.split(':', 1)[1].strip()
-                elif '.' in line and line.index('.') < 3:
-                    option_text = line.split('.', 1)[1].strip()
-                elif ')' in line and line.index(')') < 3:
-                    option_text = line.split(')', 1)[1].strip()
-                current_question['options'].append(option_text)
-            elif current_question and (line.startswith('Answer:') or line.startswith('Correct Answer:') or 
-                  (line.startswith('Correct:') or (line.lower().startswith('answer') and ':' in line))):
-                answer_text = line
-                for prefix in ['Answer:', 'Correct Answer:', 'Correct:', 'Answer']:
-                    if answer_text.startswith(prefix):
-                        answer_text = answer_text[len(prefix):].strip()
-                        break
-                current_question['correct_answer'] = answer_text
-            elif current_question and (line.startswith('Explanation:') or line.startswith('Explanation') and ':' in line):
-                explanation_text = line
-                if ':' in line:
-                    explanation_text = line.split(':', 1)[1].strip()
-                current_question['explanation'] = explanation_text
+        system, prompt = _render_prompt("quiz", _quiz_prompt(), topic=topic, difficulty=difficulty, num_questions=num_questions, focus=focus)
+        content = await call_policy.run(lambda: llm.ainvoke(prompt, system=system), admit=lambda: _upstream_slot("quiz"))
+        logger.debug("Quiz LLM call succeeded")
         
-        # Add the last question
-        if current_question:
-            questions.append(current_question)
-            
-        # If no structured questions found, try a different approach
-        if not questions:
-            # Try to split by double newlines for separate questions
-            question_blocks = content.split('\n\n')
-            for block in question_blocks:
-                if block.strip():
-                    # Create a simple question structure
-                    questions.append({
-                        'question': block.strip(),
-                        'options': [],
-                        'correct_answer': '',
-                        'explanation': ''
-                    })
-            
-        # If still no questions, create a sample question structure
-        if not questions:
-            return [{'question': 'Sample Question', 
-                    'options': ['Option A', 'Option B', 'Option C', 'Option D'], 
-                    'correct_answer': 'A', 
-                    'explanation': 'This is a sample explanation.'}]
-            
-        return questions
+        return _parse_quiz_output(content)
         
+    except AdmissionError:
+        raise
     except Exception as e:
-        print(f"Error parsing quiz response: {e}")
-        # Return the raw content as a fallback
-        return [{'question': 'Quiz Question', 'content': content}]
\ No newline at end of file
+        ERRORS.inc(stage="agenerate_quiz", type=type(e).__name__)
+        logger.exception("Error in agenerate_quiz")
+        raise Exception(f"Error in agenerate_quiz: {str(e)}") from e
+
+def _chunk_focus(topic: str, index: int, total: int) -> str:
+    """
+    Prompt hint that steers one batch of a chunked quiz to its own aspect of the topic
+    """
+    aspect = QUIZ_CHUNK_ASPECTS[index % len(QUIZ_CHUNK_ASPECTS)]
+    return f"These questions are part {index + 1} of {total} of a larger quiz. Focus on {aspect} of {topic}."
+
+async def agenerate_quiz_chunked(topic: str, difficulty: str, num_questions: int) -> list[dict]:
+    """
+    Generate a quiz as concurrent batches of QUIZ_CHUNK_SIZE questions and merge them.
+    Duplicate questions are dropped; a failed batch only loses its own questions,
+    and one extra round tops up any shortfall unless every batch failed.
+    """
+    questions = []
+    async for batch in _agenerate_quiz_batches(topic, difficulty, num_questions):
+        questions.extend(batch)
+    return questions
+
+async def _agenerate_quiz_batches(topic: str, difficulty: str, num_questions: int):
+    """
+    Yield the new (not yet seen) questions of each concurrent batch as soon as it
+    completes, until num_questions have been yielded. A second round tops up
+    the shortfall only if some batch of the first round succeeded; if none did,
+    the first batch error is raised without retrying the whole quiz.
+    """
+    fanout = asyncio.Semaphore(QUIZ_CHUNK_FANOUT)
+    
+    async def run_batch(size: int, index: int, total: int) -> list[dict]:
+        async with fanout:
+            return await _agenerate_quiz_live(topic, difficulty, size, focus=_chunk_focus(topic, index, total))
+    
+    seen = set()
+    errors = []
+    offset = 0
+    produced = 0
+    for round_number in range(2):
+        missing = num_questions - produced
+        if missing <= 0 or (round_number and not produced):
+            break
+        sizes = [min(QUIZ_CHUNK_SIZE, missing - start) for start in range(0, missing, QUIZ_CHUNK_SIZE)]
+        tasks = [
+            asyncio.create_task(run_batch(size, offset + index, offset + len(sizes)))
+            for index, size in enumerate(sizes)
+        ]
+        offset += len(sizes)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except AdmissionError:
+                    raise
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                batch = []
+                for question in result:
+                    key = question_key(question)
+                    if key not in seen and produced + len(batch) < num_questions:
+                        seen.add(key)
+                        batch.append(question)
+                if batch:
+                    produced += len(batch)
+                    yield batch
+        finally:
+            # The consumer stopped early (or a batch was not admitted): cancel the rest
+            for task in tasks:
+                task.cancel()
+    
+    if not produced and errors:
+        raise errors[0]
+    logger.info("Chunked quiz generated", extra={"questions": produced, "failed_batches": len(errors)})
+
+async def astream_quiz(topic: str, difficulty: str, num_questions: int):
+    """
+    Stream a quiz as lists of questions while it is generated: the whole quiz at
+    once from the bank or an identical non-streamed request in flight,
+    otherwise each batch as soon as its LLM call completes. Concurrent
+    identical streams share one generation, and the finished quiz is added
+    to the bank.
+    """
+    started = time.perf_counter()
+    if quiz_bank is not None:
+        banked = await asyncio.to_thread(quiz_bank.sample, topic, difficulty, num_questions)
+        if banked is not None:
+            if await asyncio.to_thread(quiz_bank.count, topic, difficulty) < QUIZ_BANK_MIN_SIZE:
+                schedule_quiz_bank_refill(topic, difficulty)
+            QUIZ_SECONDS.observe(time.perf_counter() - started, source="bank", **_quiz_labels(topic, difficulty))
+            yield banked
+            return
+    
+    async for batch in _singleflight.stream(
+        ("quiz", topic.strip().lower(), difficulty.strip().lower(), num_questions),
+        lambda: _astream_quiz_live(topic, difficulty, num_questions),
+        combine=lambda batches: [question for batch in batches for question in batch],
+    ):
+        yield batch
+    QUIZ_SECONDS.observe(time.perf_counter() - started, source="stream", **_quiz_labels(topic, difficulty))
+
+async def _astream_quiz_live(topic: str, difficulty: str, num_questions: int):
+    """
+    Generate a quiz live, yielding each batch as it completes, and add it to the bank
+    """
+    questions = []
+    if num_questions > QUIZ_CHUNK_THRESHOLD:
+        async for batch in _agenerate_quiz_batches(topic, difficulty, num_questions):
+            questions.extend(batch)
+            yield batch
+    else:
+        questions = await _agenerate_quiz_live(topic, difficulty, num_questions)
+        yield questions
+    if quiz_bank is not None:
+        await asyncio.to_thread(quiz_bank.add, topic, difficulty, questions)
+        schedule_quiz_bank_refill(topic, difficulty)
+
+async def refill_quiz_bank(topic: str, difficulty: str, target: int = None,
+                           keep_going: Optional[Callable[[], bool]] = None):
+    """
+    Generate questions into the bank until the pair holds target (by default
+    QUIZ_BANK_MIN_SIZE) questions, or until keep_going(), checked before every
+    LLM call, returns False. Stops as soon as the worker starts draining.
+    """
+    target = target or QUIZ_BANK_MIN_SIZE
+    # Stop after a few rounds that add nothing new so duplicates cannot loop forever
+    stale_rounds = 0
+    while await asyncio.to_thread(quiz_bank.count, topic, difficulty) < target and stale_rounds < 3:
+        if _draining:
+            return
+        if keep_going is not None and not keep_going():
+            return
+        questions = await _agenerate_quiz_live(topic, difficulty, QUIZ_BANK_BATCH_SIZE)
+        added = await asyncio.to_thread(quiz_bank.add, topic, difficulty, questions)
+        logger.info("Added questions to quiz bank", extra={"added": added, "topic": topic, "difficulty": difficulty})
+        stale_rounds = stale_rounds + 1 if added == 0 else 0
+
+def schedule_quiz_bank_refill(topic: str, difficulty: str):
+    """
+    Refill the bank for the pair in the background, at most one refill per pair
+    at a time and one per QUIZ_BANK_REFILL_INTERVAL. Free-form topics outside
+    the fixed grid are never refilled: their bank only holds what clients asked for.
+    """
+    pair = (topic.strip().lower(), difficulty.strip().lower())
+    if quiz_bank is None or initialization_error is not None or _draining or pair in _refilling_pairs:
+        return
+    if not _on_quiz_grid(topic, difficulty):
+        return
+    now = time.monotonic()
+    if now - _last_refills.get(pair, float("-inf")) < QUIZ_BANK_REFILL_INTERVAL:
+        return
+    _last_refills[pair] = now
+    claim = f"quiz-bank-refill:{pair[0]}/{pair[1]}"
+    
+    async def run_refill():
+        claimed = False
+        try:
+            # The interval claim is never released, so it rate-limits the pair across
+            # workers until it expires; the refill claim keeps one refill per pair running
+            if not await aclaim_once(f"quiz-bank-refill-interval:{pair[0]}/{pair[1]}", ttl=QUIZ_BANK_REFILL_INTERVAL):
+                return
+            claimed = await aclaim_once(claim, ttl=600)
+            if claimed:
+                await refill_quiz_bank(topic, difficulty)
+        except Exception as e:
+            ERRORS.inc(stage="quiz_bank_refill", type=type(e).__name__)
+            logger.warning("Quiz bank refill failed for %s/%s: %s", topic, difficulty, e)
+        finally:
+            _refilling_pairs.discard(pair)
+            if claimed:
+                await arelease_claim(claim)
+    
+    _refilling_pairs.add(pair)
+    task = asyncio.create_task(run_refill())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def fill_quiz_bank():
+    """
+    Fill the bank for the whole topic x difficulty grid, one pair at a time.
+    Only one worker does this when several start together.
+    """
+    if quiz_bank is None or not await aclaim_once("quiz-bank-prefill", ttl=3600):
+        return
+    for topic in QUIZ_TOPICS:
+        for difficulty in QUIZ_DIFFICULTIES:
+            if _draining:
+                return
+            try:
+                await refill_quiz_bank(topic, difficulty)
+            except Exception as e:
+                ERRORS.inc(stage="quiz_bank_prefill", type=type(e).__name__)
+                logger.warning("Quiz bank prefill failed for %s/%s: %s", topic, difficulty, e)
+
+# Speculative prefetch: the frontend hints which (topic, difficulty) the user is
+# looking at, and the bank for that pair is filled in the background so that
+# "Generate Quiz" is served from it. Prefetches are the lowest priority work:
+# each LLM call only starts while no real request is queued for admission and
+# at most half the upstream slots are busy, at most QUIZ_PREFETCH_MAX_IN_FLIGHT
+# run at once, and together they make at most QUIZ_PREFETCH_CALLS_PER_MINUTE
+# calls. A newer hint from the same client cancels that client's older one.
+QUIZ_PREFETCH_ENABLED = os.getenv("QUIZ_PREFETCH_ENABLED", "true").lower() == "true"
+QUIZ_PREFETCH_MAX_IN_FLIGHT = int(os.getenv("QUIZ_PREFETCH_MAX_IN_FLIGHT", "1"))
+QUIZ_PREFETCH_CALLS_PER_MINUTE = int(os.getenv("QUIZ_PREFETCH_CALLS_PER_MINUTE", "6"))
+_prefetches: dict[str, tuple[tuple[str, str], asyncio.Task]] = {}
+_prefetch_calls: deque[float] = deque()
+_prefetch_counts = {"hints": 0, "started": 0, "cancelled": 0, "completed": 0, "stopped": 0, "calls": 0}
+
+def _prefetch_budget_left() -> bool:
+    now = time.monotonic()
+    while _prefetch_calls and _prefetch_calls[0] < now - 60:
+        _prefetch_calls.popleft()
+    return len(_prefetch_calls) < QUIZ_PREFETCH_CALLS_PER_MINUTE
+
+def _upstream_idle() -> bool:
+    """
+    Whether a background call can start without delaying real requests
+    """
+    return _limiter.waiting == 0 and _limiter.in_flight < max(1, _limiter.max_concurrency // 2)
+
+def _prefetch_may_call() -> bool:
+    """
+    Check before each prefetch LLM call, and spend one call of the budget if allowed
+    """
+    if _draining or not _upstream_idle() or not _prefetch_budget_left():
+        return False
+    _prefetch_calls.append(time.monotonic())
+    _prefetch_counts["calls"] += 1
+    return True
+
+async def prefetch_quiz(topic: str, difficulty: str, num_questions: int, client_id: str) -> dict:
+    """
+    Hint that client_id is about to ask for num_questions questions on (topic, difficulty).
+    Returns {"status": ...}: "ready" if the bank can already serve it,
+    "scheduled" if a background fill was started, or "skipped" with a reason.
+    """
+    _prefetch_counts["hints"] += 1
+    pair = (topic.strip().lower(), difficulty.strip().lower())
+    previous = _prefetches.get(client_id)
+    if previous is not None and previous[0] != pair and not previous[1].done():
+        previous[1].cancel()
+        del _prefetches[client_id]
+        previous = None
+        _prefetch_counts["cancelled"] += 1
+    
+    if not QUIZ_PREFETCH_ENABLED or quiz_bank is None:
+        return {"status": "skipped", "reason": "disabled"}
+    if await asyncio.to_thread(quiz_bank.count, topic, difficulty) >= num_questions:
+        return {"status": "ready"}
+    if previous is not None and previous[0] == pair and not previous[1].done():
+        return {"status": "scheduled"}
+    if _draining or initialization_error is not None:
+        return {"status": "skipped", "reason": "unavailable"}
+    if pair in _refilling_pairs:
+        return {"status": "skipped", "reason": "already_filling"}
+    running = sum(1 for _, task in _prefetches.values() if not task.done())
+    if running >= QUIZ_PREFETCH_MAX_IN_FLIGHT:
+        return {"status": "skipped", "reason": "busy"}
+    if not _upstream_idle() or not _prefetch_budget_left():
+        return {"status": "skipped", "reason": "budget"}
+    # Shares the refill claim, so a pair is never filled twice across workers
+    claim = f"quiz-bank-refill:{pair[0]}/{pair[1]}"
+    if not await aclaim_once(claim, ttl=600):
+        return {"status": "skipped", "reason": "already_filling"}
+    
+    async def run_prefetch():
+        try:
+            await refill_quiz_bank(topic, difficulty, target=num_questions, keep_going=_prefetch_may_call)
+            if await asyncio.to_thread(quiz_bank.count, topic, difficulty) >= num_questions:
+                _prefetch_counts["completed"] += 1
+            else:
+                _prefetch_counts["stopped"] += 1
+        except asyncio.CancelledError:
+            logger.info("Quiz prefetch cancelled", extra={"topic": topic, "difficulty": difficulty})
+            raise
+        except Exception as e:
+            ERRORS.inc(stage="quiz_prefetch", type=type(e).__name__)
+            logger.warning("Quiz prefetch failed for %s/%s: %s", topic, difficulty, e)
+        finally:
+            _refilling_pairs.discard(pair)
+            await arelease_claim(claim)
+            if _prefetches.get(client_id, (None, None))[1] is task:
+                del _prefetches[client_id]
+    
+    _refilling_pairs.add(pair)
+    task = asyncio.create_task(run_prefetch())
+    _prefetches[client_id] = (pair, task)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    _prefetch_counts["started"] += 1
+    logger.info("Quiz prefetch started", extra={"topic": topic, "difficulty": difficulty})
+    return {"status": "scheduled"}
+
+def cancel_prefetches():
+    """
+    Cancel every running prefetch (on shutdown)
+    """
+    for _, task in list(_prefetches.values()):
+        task.cancel()
+
+def _parse_quiz_response(content: str) -> list[dict]:
+    """
+    Parse the AI-generated quiz content into structured questions.
+    """
+    questions = parse_quiz(content)
+    if not questions:
+        raise Exception("Could not parse any quiz questions from the model output")
+    return [question.to_dict() for question in questions]
+
+def _quiz_prompt() -> PromptTemplate:
+    """
+    Return the quiz prompt for the configured output mode
+    """
+    return QUIZ_JSON_PROMPT if QUIZ_OUTPUT_MODE == "json" else QUIZ_PROMPT
+
+def _parse_quiz_output(content: str) -> list[dict]:
+    """
+    Parse quiz output for the configured mode, falling back to the text parser
+    when structured output yields no valid question
+    """
+    with QUIZ_PARSE_SECONDS.time(mode=QUIZ_OUTPUT_MODE):
+        if QUIZ_OUTPUT_MODE == "json":
+            questions = parse_quiz_json(content)
+            if questions:
+                _quiz_parse_counts["json"] += 1
+                return [question.to_dict() for question in questions]
+            logger.warning("Structured quiz output was not valid JSON, falling back to text parser")
+            _quiz_parse_counts["text_fallback"] += 1
+        else:
+            _quiz_parse_counts["text"] += 1
+        return _parse_quiz_response(content)
@@ -0,0 +1,254 @@
+# src/ai_engine/call_policy.py
+# Timeout, retry and hedging policy for upstream LLM calls
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, Optional
+
+from .rate_limiter import AdmissionError, is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+_TRANSIENT_ERROR_NAMES = frozenset({
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+    "BadGateway", "ServerError",
+})
+_TRANSIENT_STATUS_CODES = frozenset({500, 502, 503, 504})
+_TRANSIENT_MARKERS = ("503", "unavailable", "deadline exceeded", "connection reset", "temporarily")
+
+
+class CallTimeoutError(Exception):
+    """
+    An LLM call did not finish within its deadline
+    """
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether a failed call is worth retrying: timeouts, connection errors and 5xx
+    responses. Rate limits are not retried here; the admission limiter backs off instead.
+    """
+    if isinstance(error, AdmissionError) or is_rate_limit_error(error):
+        return False
+    if isinstance(error, (CallTimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_ERROR_NAMES:
+        return True
+    for attribute in ("status_code", "code"):
+        if getattr(error, attribute, None) in _TRANSIENT_STATUS_CODES:
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS)
+
+
+def _discard_result(task: asyncio.Task):
+    # Mark the losing attempt's exception as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class CallPolicy:
+    """
+    Run upstream calls with a per-attempt timeout, an overall deadline,
+    exponential-backoff retries on transient errors and optional hedging.
+
+    With hedging enabled, once hedge_min_samples latencies have been seen, a
+    call still running after the hedge_quantile (p95 by default) latency gets
+    a second, identical call and whichever succeeds first is used; the other
+    is cancelled. Hedges are capped at hedge_budget of all calls so a slow
+    provider is not hit with twice the load.
+    """
+
+    def __init__(self, attempt_timeout: float = 60.0, deadline: float = 90.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20, hedge_budget: float = 0.1):
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget = hedge_budget
+        self._latencies: deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Latency quantile of recent successful attempts, or None if hedging is off
+        or there are not enough samples yet
+        """
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def _backoff(self, retry: int) -> float:
+        # Full jitter: spread retries from many callers over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    async def _attempt(self, call: Callable[[], Awaitable], admit, timeout: float):
+        async with admit():
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise CallTimeoutError(f"LLM call timed out after {timeout:.1f}s") from None
+            self._latencies.append(time.monotonic() - started)
+            return result
+
+    async def _hedged_attempt(self, call: Callable[[], Awaitable], admit, timeout: float):
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout or self.hedges_started >= self.hedge_budget * self.calls:
+            return await self._attempt(call, admit, timeout)
+
+        primary = asyncio.ensure_future(self._attempt(call, admit, timeout))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.hedges_started += 1
+            hedge = asyncio.ensure_future(self._attempt(call, admit, timeout))
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    if winners[0] is hedge:
+                        self.hedges_won += 1
+                    return winners[0].result()
+            # Both attempts failed: report the primary's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard_result)
+
+    async def run(self, call: Callable[[], Awaitable], admit: Callable[[], AsyncContextManager] = nullcontext):
+        """
+        Await call() under the policy. admit() is entered around every attempt,
+        including hedges, so each one is counted against the upstream limits.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                return await self._hedged_attempt(call, admit, min(self.attempt_timeout, remaining))
+            except Exception as e:
+                backoff = self._backoff(retry)
+                if not is_transient_error(e) or retry >= self.max_retries or time.monotonic() + backoff >= deadline:
+                    self.failures += 1
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning("Retrying LLM call after transient error (%d/%d): %s", retry, self.max_retries, e)
+                await asyncio.sleep(backoff)
+
+    async def stream(self, open_stream: Callable, admit: Callable[[], AsyncContextManager] = nullcontext):
+        """
+        Stream chunks from open_stream() under the policy. Failures before the
+        first chunk are retried; after that the stream is only guarded against
+        stalls longer than the attempt timeout. Streams are never hedged.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            started = False
+            try:
+                async with admit():
+                    attempt_started = time.monotonic()
+                    chunks = open_stream()
+                    try:
+                        while True:
+                            timeout = min(self.attempt_timeout, max(0.0, deadline - time.monotonic()))
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                            except StopAsyncIteration:
+                                break
+                            except asyncio.TimeoutError:
+                                self.timeouts += 1
+                                raise CallTimeoutError(f"LLM stream stalled for {timeout:.1f}s") from None
+                            if not started:
+                                started = True
+                                self._latencies.append(time.monotonic() - attempt_started)
+                            yield chunk
+                    finally:
+                        await chunks.aclose()
+                return
+            except Exception as e:
+                backoff = self._backoff(retry)
+                if started or not is_transient_error(e) or retry >= self.max_retries \
+                        or time.monotonic() + backoff >= deadline:
+                    self.failures += 1
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning("Retrying LLM stream after transient error (%d/%d): %s", retry, self.max_retries, e)
+                await asyncio.sleep(backoff)
+
+    def run_sync(self, call: Callable):
+        """
+        Blocking variant of run: retries only. The provider client enforces the timeout.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + self.deadline
+        retry = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                backoff = self._backoff(retry)
+                if not is_transient_error(e) or retry >= self.max_retries or time.monotonic() + backoff >= deadline:
+                    self.failures += 1
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning("Retrying LLM call after transient error (%d/%d): %s", retry, self.max_retries, e)
+                time.sleep(backoff)
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "hedging": self.hedge,
+            "hedge_delay": round(delay, 3) if delay is not None else None,
+            "hedges_started": self.hedges_started,
+            "hedges_won": self.hedges_won,
+        }
+
+
+def create_call_policy() -> CallPolicy:
+    """
+    Build the call policy from environment settings
+    """
+    return CallPolicy(
+        attempt_timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+        deadline=float(os.getenv("LLM_CALL_DEADLINE", "90")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        backoff_base=float(os.getenv("LLM_RETRY_BACKOFF_BASE", "0.5")),
+        backoff_max=float(os.getenv("LLM_RETRY_BACKOFF_MAX", "8")),
+        hedge=os.getenv("LLM_HEDGING", "false").lower() == "true",
+        hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+        hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        hedge_budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.1")),
+    )
@@ -0,0 +1,263 @@
+# src/ai_engine/cassette.py
+# Record real LLM calls to an on-disk cassette and replay them offline
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Optional
+
+from .metrics import LLM_TOKENS
+from .providers import LLMProvider, estimate_tokens
+from .shared_state import connect_sqlite, state_path
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(LookupError):
+    """
+    A replayed call has no recording in the cassette
+    """
+
+
+def call_key(prompt: str, system: Optional[str] = None) -> str:
+    """
+    Index key of a call: a hash of its system instruction and prompt
+    """
+    return hashlib.sha256(f"{system or ''}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+
+def _pack(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _unpack(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+class Cassette:
+    """
+    SQLite file of recorded LLM calls, indexed by call_key.
+
+    Prompts and responses are stored zlib-compressed, and each distinct system
+    instruction is stored once. A call recorded several times keeps every
+    recording (seq 0, 1, ...) so replay can reproduce varied outputs.
+    Each recording keeps its time to first chunk and total time, plus
+    the chunk boundaries and their timings for streamed calls.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS systems (id TEXT PRIMARY KEY, text BLOB NOT NULL)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS calls (
+                key TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                system_id TEXT,
+                prompt BLOB NOT NULL,
+                response BLOB NOT NULL,
+                first_chunk_seconds REAL NOT NULL,
+                total_seconds REAL NOT NULL,
+                chunks TEXT,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (key, seq)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def add(self, prompt: str, system: Optional[str], response: str, first_chunk_seconds: float,
+            total_seconds: float, chunks: Optional[list[tuple[int, float]]] = None):
+        """
+        Record one call. chunks lists (end offset in response, seconds since the call started) per streamed chunk.
+        The write lock is taken up front, so workers recording into the same file get distinct seq numbers.
+        """
+        key = call_key(prompt, system)
+        system_id = hashlib.sha256(system.encode("utf-8")).hexdigest() if system is not None else None
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                if system_id is not None:
+                    self._conn.execute("INSERT OR IGNORE INTO systems (id, text) VALUES (?, ?)",
+                                       (system_id, _pack(system)))
+                seq = self._conn.execute("SELECT COUNT(*) FROM calls WHERE key = ?", (key,)).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO calls (key, seq, system_id, prompt, response, first_chunk_seconds, total_seconds, "
+                    "chunks, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, seq, system_id, _pack(prompt), _pack(response), first_chunk_seconds, total_seconds,
+                     json.dumps(chunks) if chunks else None, time.time()),
+                )
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM calls WHERE key = ?", (key,)).fetchone()[0]
+
+    def get(self, key: str, seq: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, first_chunk_seconds, total_seconds, chunks FROM calls WHERE key = ? AND seq = ?",
+                (key, seq),
+            ).fetchone()
+        if row is None:
+            return None
+        response, first_chunk_seconds, total_seconds, chunks = row
+        return {
+            "response": _unpack(response),
+            "first_chunk_seconds": first_chunk_seconds,
+            "total_seconds": total_seconds,
+            "chunks": json.loads(chunks) if chunks else None,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls, keys = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT key) FROM calls").fetchone()
+        return {"path": self.path, "recordings": calls, "distinct_calls": keys,
+                "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Pass calls through to another provider and record every successful one
+    (prompt, response and timings) in the cassette. Failed or abandoned
+    calls are not recorded, and a call whose recording fails is logged and
+    still returns its result.
+    """
+
+    def __init__(self, inner: LLMProvider, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+        self.name = inner.name
+
+    def _record(self, prompt: str, system: Optional[str], response: str, first_chunk_seconds: float,
+                total_seconds: float, chunks: Optional[list[tuple[int, float]]] = None):
+        try:
+            self.cassette.add(prompt, system, response, first_chunk_seconds, total_seconds, chunks)
+        except Exception as e:
+            logger.warning("Failed to record LLM call in %s: %s", self.cassette.path, e)
+
+    def invoke(self, prompt: str, system: Optional[str] = None) -> str:
+        started = time.monotonic()
+        text = self.inner.invoke(prompt, system)
+        elapsed = time.monotonic() - started
+        self._record(prompt, system, text, elapsed, elapsed)
+        return text
+
+    async def ainvoke(self, prompt: str, system: Optional[str] = None) -> str:
+        started = time.monotonic()
+        text = await self.inner.ainvoke(prompt, system)
+        elapsed = time.monotonic() - started
+        await asyncio.to_thread(self._record, prompt, system, text, elapsed, elapsed)
+        return text
+
+    async def astream(self, prompt: str, system: Optional[str] = None):
+        started = time.monotonic()
+        parts = []
+        chunks = []
+        length = 0
+        async for text in self.inner.astream(prompt, system):
+            length += len(text)
+            parts.append(text)
+            chunks.append((length, round(time.monotonic() - started, 4)))
+            yield text
+        if chunks:
+            await asyncio.to_thread(self._record, prompt, system, "".join(parts), chunks[0][1],
+                                    time.monotonic() - started, chunks)
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+    def stats(self) -> dict:
+        return {"mode": "record", **self.cassette.stats()}
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Serve calls from a cassette without any network access.
+
+    Each call gets the recording for its exact system instruction and prompt.
+    A call recorded n times cycles through its n recordings in order, so a
+    replay run returns the same outputs in the same order every time. Timings
+    are reproduced multiplied by latency_scale (0 replays with no delay), and
+    streams are re-chunked at their recorded boundaries. A call that was never
+    recorded raises CassetteMissError.
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._next_seq: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _next_recording(self, prompt: str, system: Optional[str]) -> dict:
+        key = call_key(prompt, system)
+        recorded = self.cassette.count(key)
+        if not recorded:
+            self.misses += 1
+            raise CassetteMissError(f"No recording for this call in {self.cassette.path}")
+        with self._lock:
+            seq = self._next_seq.get(key, 0)
+            self._next_seq[key] = seq + 1
+            self.hits += 1
+        recording = self.cassette.get(key, seq % recorded)
+        LLM_TOKENS.inc(estimate_tokens(prompt) + estimate_tokens(system or ""), provider=self.name, direction="input")
+        LLM_TOKENS.inc(estimate_tokens(recording["response"]), provider=self.name, direction="output")
+        return recording
+
+    def invoke(self, prompt: str, system: Optional[str] = None) -> str:
+        recording = self._next_recording(prompt, system)
+        time.sleep(recording["total_seconds"] * self.latency_scale)
+        return recording["response"]
+
+    async def ainvoke(self, prompt: str, system: Optional[str] = None) -> str:
+        recording = await asyncio.to_thread(self._next_recording, prompt, system)
+        await asyncio.sleep(recording["total_seconds"] * self.latency_scale)
+        return recording["response"]
+
+    async def astream(self, prompt: str, system: Optional[str] = None):
+        recording = await asyncio.to_thread(self._next_recording, prompt, system)
+        response = recording["response"]
+        chunks = recording["chunks"] or [(len(response), recording["total_seconds"])]
+        start = 0
+        elapsed = 0.0
+        for end, at in chunks:
+            await asyncio.sleep(max(0.0, at - elapsed) * self.latency_scale)
+            elapsed = at
+            yield response[start:end]
+            start = end
+
+    def warm_up(self):
+        # Nothing to connect to
+        pass
+
+    def stats(self) -> dict:
+        return {"mode": "replay", "latency_scale": self.latency_scale, "hits": self.hits, "misses": self.misses,
+                **self.cassette.stats()}
+
+
+def wrap_provider(create_inner) -> LLMProvider:
+    """
+    Apply LLM_CASSETTE_MODE to provider creation: "record" wraps the provider
+    built by create_inner() in a RecordingProvider, "replay" replaces it with a
+    ReplayProvider (so no API key is needed), and "off" (default) returns it as is.
+    The cassette is LLM_CASSETTE_PATH; LLM_CASSETTE_LATENCY_SCALE scales replayed timings.
+    """
+    mode = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    if mode == "off":
+        return create_inner()
+    cassette = Cassette(os.getenv("LLM_CASSETTE_PATH", state_path("llm_cassette.sqlite3")))
+    if mode == "record":
+        return RecordingProvider(create_inner(), cassette)
+    if mode == "replay":
+        return ReplayProvider(cassette, latency_scale=float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0")))
+    raise ValueError(f"Unknown LLM_CASSETTE_MODE: {mode}")
@@ -0,0 +1,272 @@
+# src/ai_engine/job_queue.py
+# Asynchronous job queue for long-running generations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from .rate_limiter import AdmissionError, EngineOverloadedError
+from .shared_state import connect_sqlite, state_path
+
+logger = logging.getLogger(__name__)
+
+JOB_PRIORITIES = {"low": 0, "normal": 1, "high": 2}
+
+_FINISHED_STATES = ("done", "failed")
+
+
+class JobQueue:
+    """
+    Priority job queue stored in SQLite and executed by a pool of asyncio
+    workers in every backend process.
+
+    Because the queue lives in the shared state directory, a job submitted
+    to one worker process can be run by, and polled from, any of them.
+    Higher priorities run first, then oldest first. Submissions beyond
+    max_depth queued jobs are rejected with EngineOverloadedError. Jobs left
+    running by a process that died are requeued after stale_after seconds,
+    and finished jobs are kept for result_ttl seconds.
+
+    The file is shared with other processes, so a call may wait on their
+    writes: the public methods are async and run the SQLite work in a thread.
+    """
+
+    def __init__(self, path: str, handlers: dict[str, Callable[[dict], Awaitable]], workers: int = 4,
+                 max_depth: int = 100, poll_interval: float = 0.5, stale_after: float = 300.0,
+                 result_ttl: float = 3600.0):
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_depth = max_depth
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                error_status INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at)")
+        self._conn.commit()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def submit(self, kind: str, payload: dict, priority: str = "normal") -> dict:
+        """
+        Queue a job and return its record. Raises EngineOverloadedError when the queue is full.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await asyncio.to_thread(self._insert, kind, payload, priority)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """
+        The job's public record, or None if it is unknown or expired
+        """
+        return await asyncio.to_thread(self._read, job_id)
+
+    def _insert(self, kind: str, payload: dict, priority: str) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if depth >= self.max_depth:
+                self.rejected += 1
+                raise EngineOverloadedError(f"Job queue is full ({depth} jobs queued)", retry_after=10.0)
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), JOB_PRIORITIES[priority], time.time()),
+            )
+            self._conn.commit()
+        return self._read(job_id)
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, priority, status, result, error, error_status, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[3] == "queued":
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (row[2], row[2], row[7]),
+                ).fetchone()[0]
+        job_id, kind, priority, status, result, error, error_status, created_at, started_at, finished_at = row
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "priority": next(name for name, value in JOB_PRIORITIES.items() if value == priority),
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+            job["error_status"] = error_status
+        return job
+
+    def _claim(self) -> Optional[tuple[str, str, dict]]:
+        """
+        Atomically take the next queued (or stale running) job for this process
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT id, kind, payload FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND started_at < ?) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now - self.stale_after,),
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (now, row[0]))
+        return row[0], row[1], json.loads(row[2])
+
+    def _finish(self, job_id: str, result=None, error: str = None, error_status: int = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, error_status = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error is not None else "done", json.dumps(result) if error is None else None,
+                 error, error_status, time.time(), job_id),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.result_ttl,),
+            )
+            self._conn.commit()
+
+    def _requeue(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    async def _worker(self):
+        while not self._stopping:
+            claimed = await asyncio.to_thread(self._claim)
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, kind, payload = claimed
+            try:
+                result = await self.handlers[kind](payload)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back for another worker or the next start
+                await asyncio.to_thread(self._requeue, job_id)
+                raise
+            except AdmissionError as e:
+                logger.warning("Job not admitted: %s", e, extra={"job_id": job_id, "kind": kind})
+                self.failed += 1
+                await asyncio.to_thread(self._finish, job_id, error=e.client_message, error_status=e.status_code)
+            except Exception:
+                logger.exception("Error in job", extra={"job_id": job_id, "kind": kind})
+                self.failed += 1
+                await asyncio.to_thread(self._finish, job_id, error=f"Generation failed (job {job_id})",
+                                        error_status=500)
+            else:
+                self.completed += 1
+                await asyncio.to_thread(self._finish, job_id, result=result)
+
+    def start(self):
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop_claiming(self):
+        """
+        Let the workers finish the jobs they are running but claim no new ones
+        """
+        self._stopping = True
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 0.0):
+        """
+        Stop claiming jobs and wait up to timeout seconds for the running ones
+        to finish; workers still busy after that are cancelled and their jobs
+        go back to the queue
+        """
+        self.stop_claiming()
+        if self._tasks and timeout > 0:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """
+        Wait up to timeout seconds for the job to finish and return its record
+        """
+        deadline = time.monotonic() + timeout
+        job = await self.get(job_id)
+        while job is not None and job["status"] not in _FINISHED_STATES and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            job = await self.get(job_id)
+        return job
+
+    async def stats(self) -> dict:
+        rows = await asyncio.to_thread(self._count_by_status)
+        return {
+            "workers": len(self._tasks),
+            "max_depth": self.max_depth,
+            "jobs": dict(rows),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def _count_by_status(self) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+
+
+def create_job_queue(handlers: dict[str, Callable[[dict], Awaitable]]) -> JobQueue:
+    """
+    Build the job queue from environment settings
+    """
+    return JobQueue(
+        os.getenv("JOB_QUEUE_PATH", state_path("jobs.sqlite3")),
+        handlers,
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_depth=int(os.getenv("JOB_MAX_QUEUE", "100")),
+        stale_after=float(os.getenv("JOB_STALE_AFTER", "300")),
+        result_ttl=float(os.getenv("JOB_RESULT_TTL", "3600")),
+    )
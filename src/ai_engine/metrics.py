@@ -0,0 +1,211 @@
+# src/ai_engine/metrics.py
+# In-process metrics rendered in the Prometheus text exposition format
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache hits up to long quiz generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, per label set
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, per label set
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets, per label set
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (the last one is +Inf), sum, count
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the with block, whether or not it raises
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        lines = []
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    All registered metrics in the Prometheus text format
+    """
+    return "\n".join(metric.render() for metric in _REGISTRY) + "\n"
+
+
+# Metrics shared by the engine, the providers and the backend
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ai_tutor_http_request_duration_seconds",
+    "Time to produce the response headers, by endpoint, method and status",
+    ("endpoint", "method", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("ai_tutor_http_requests_in_flight", "HTTP requests being handled")
+RESPONSE_SECONDS = Histogram(
+    "ai_tutor_response_duration_seconds",
+    "Tutor response time by style and source (cache, live, stream)",
+    ("style", "source"),
+)
+QUIZ_SECONDS = Histogram(
+    "ai_tutor_quiz_duration_seconds",
+    "Quiz generation time by topic, difficulty and source (bank, live, stream)",
+    ("topic", "difficulty", "source"),
+)
+PROMPT_RENDER_SECONDS = Histogram(
+    "ai_tutor_prompt_render_seconds", "Prompt template rendering time", ("template",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01),
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "ai_tutor_llm_queue_wait_seconds", "Time an LLM call waited for admission", ("operation",)
+)
+LLM_CALL_SECONDS = Histogram(
+    "ai_tutor_llm_call_duration_seconds", "Upstream LLM call time per attempt", ("operation",)
+)
+LLM_IN_FLIGHT = Gauge("ai_tutor_llm_calls_in_flight", "Upstream LLM calls in progress", ("operation",))
+QUIZ_PARSE_SECONDS = Histogram(
+    "ai_tutor_quiz_parse_seconds", "Time to parse LLM quiz output", ("mode",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+ERRORS = Counter("ai_tutor_errors_total", "Errors by stage and exception type", ("stage", "type"))
+LLM_TOKENS = Counter(
+    "ai_tutor_llm_tokens_total",
+    "Tokens sent to and received from the LLM provider (direction input, output, or cached_input "
+    "for input tokens the provider served from its context cache)",
+    ("provider", "direction"),
+)
+PROMPT_TOKENS = Counter(
+    "ai_tutor_prompt_tokens_total",
+    "Estimated prompt tokens by template and part (static system instruction, variable per-request text)",
+    ("template", "part"),
+)
@@ -0,0 +1,334 @@
+# src/ai_engine/providers.py
+# LLM provider interface, the Gemini provider and an offline fake provider
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Optional
+
+from .metrics import LLM_TOKENS
+
+WARMUP_PROMPT = "Hello, this is a warmup request."
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text (about four characters per token)
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+class LLMProvider:
+    """
+    Interface the engine uses to talk to an LLM: a rendered prompt, and
+    optionally the static system instruction it belongs to, go in; text comes out.
+    Subclasses implement invoke; the async methods default to running it in a thread.
+    """
+
+    name = "base"
+
+    def invoke(self, prompt: str, system: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    async def ainvoke(self, prompt: str, system: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.invoke, prompt, system)
+
+    async def astream(self, prompt: str, system: Optional[str] = None):
+        yield await self.ainvoke(prompt, system)
+
+    def warm_up(self):
+        self.invoke(WARMUP_PROMPT)
+
+
+def _message_text(message) -> str:
+    """
+    Extract the text content from a LangChain message or chunk
+    """
+    return str(message.content) if hasattr(message, 'content') else str(message)
+
+
+def _record_usage(provider: str, message):
+    """
+    Count the tokens reported in a LangChain message's usage metadata,
+    including input tokens read from the provider's context cache.
+    Streamed chunks report their own share, so they are simply added up.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        LLM_TOKENS.inc(usage["input_tokens"], provider=provider, direction="input")
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached:
+        LLM_TOKENS.inc(cached, provider=provider, direction="cached_input")
+    if usage.get("output_tokens"):
+        LLM_TOKENS.inc(usage["output_tokens"], provider=provider, direction="output")
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini through LangChain's ChatGoogleGenerativeAI.
+
+    A system instruction is sent as Gemini's system_instruction, ahead of the
+    prompt, so the same static prefix starts every call that uses it. Gemini
+    only serves prefixes above its minimum cacheable size from its context
+    cache; cached_input counts just the cache reads Gemini reports. The
+    messages are built once per distinct instruction.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model: str = "gemini-pro-latest", temperature: float = 0.7, timeout: float = None):
+        import google.generativeai as genai
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise Exception("GOOGLE_API_KEY environment variable is not set")
+
+        # Configure the Google Generative AI library
+        genai.configure(api_key=api_key)
+
+        # Convert api_key to string to avoid validation errors
+        self.llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=str(api_key),
+            temperature=temperature,
+            timeout=timeout
+        )
+        self._system_messages = {}
+
+    def _messages(self, prompt: str, system: Optional[str]):
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        if system is None:
+            return prompt
+        message = self._system_messages.get(system)
+        if message is None:
+            message = self._system_messages[system] = SystemMessage(content=system)
+        return [message, HumanMessage(content=prompt)]
+
+    def invoke(self, prompt: str, system: Optional[str] = None) -> str:
+        message = self.llm.invoke(self._messages(prompt, system))
+        _record_usage(self.name, message)
+        return _message_text(message)
+
+    async def ainvoke(self, prompt: str, system: Optional[str] = None) -> str:
+        message = await self.llm.ainvoke(self._messages(prompt, system))
+        _record_usage(self.name, message)
+        return _message_text(message)
+
+    async def astream(self, prompt: str, system: Optional[str] = None):
+        async for chunk in self.llm.astream(self._messages(prompt, system)):
+            _record_usage(self.name, chunk)
+            text = _message_text(chunk)
+            if text:
+                yield text
+
+
+class FakeProviderError(Exception):
+    """
+    Failure injected by FakeProvider, shaped like an upstream HTTP 503
+    """
+
+    code = 503
+
+
+class FakeRateLimitError(FakeProviderError):
+    """
+    Quota rejection injected by FakeProvider, shaped like an upstream HTTP 429
+    """
+
+    code = 429
+
+
+_QUIZ_REQUEST_RE = re.compile(r"Create (\d+) multiple-choice questions about (.+?) at (.+?) level")
+
+_FAKE_VOCABULARY = (
+    "abstraction algorithm cache concurrency consistency database deadlock encapsulation "
+    "gradient hashing index inheritance isolation kernel latency layer memory model network "
+    "normalization optimization partition pipeline polymorphism process protocol query queue "
+    "recursion replication scheduling schema semaphore sharding stack thread throughput "
+    "transaction tree vector virtualization"
+).split()
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline, deterministic stand-in for a real LLM, for load tests and benchmarks.
+
+    The same prompt always produces the same text. Quiz prompts get quiz-shaped
+    output (JSON or the numbered text format, matching the prompt); anything
+    else gets response_tokens words of tutor-style prose. Each call waits
+    latency seconds before the first token and then emits tokens_per_second,
+    fails with probability failure_rate, and is rejected as rate limited
+    (HTTP 429) with probability rate_limit_rate. With probability slow_rate a
+    call waits slow_latency seconds longer, to simulate a slow tail.
+
+    With prefill_tokens_per_second set, input tokens also take time to
+    process before the first token. Like a provider context cache, a system
+    instruction seen before is served from cache, but only when it is at least
+    min_cache_tokens long (Gemini does not cache shorter prefixes): a cached
+    instruction adds no prefill time and is reported as cached input tokens.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 200.0,
+                 failure_rate: float = 0.0, seed: int = 0, response_tokens: int = 200,
+                 rate_limit_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 10.0,
+                 prefill_tokens_per_second: float = 0.0, min_cache_tokens: int = 1024):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.response_tokens = response_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.min_cache_tokens = min_cache_tokens
+        self._failure_rng = random.Random(seed)
+        self._cached_prefixes: set[str] = set()
+
+    def _maybe_fail(self):
+        if self.rate_limit_rate and self._failure_rng.random() < self.rate_limit_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota)")
+        if self.failure_rate and self._failure_rng.random() < self.failure_rate:
+            raise FakeProviderError("Injected fake LLM failure")
+
+    def _first_token_latency(self, uncached_input_tokens: int = 0) -> float:
+        latency = self.latency
+        if self.prefill_tokens_per_second > 0:
+            latency += uncached_input_tokens / self.prefill_tokens_per_second
+        if self.slow_rate and self._failure_rng.random() < self.slow_rate:
+            return latency + self.slow_latency
+        return latency
+
+    def _generation_time(self, text: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return len(text.split()) / self.tokens_per_second
+
+    def _quiz_response(self, rng: random.Random, match, as_json: bool) -> str:
+        count, topic = int(match.group(1)), match.group(2)
+        tag = f"{rng.getrandbits(32):08x}"
+        questions = []
+        for index in range(count):
+            term = rng.choice(_FAKE_VOCABULARY)
+            options = [f"{rng.choice(_FAKE_VOCABULARY)} {rng.choice(_FAKE_VOCABULARY)}" for _ in range(4)]
+            questions.append({
+                "question": f"Which statement about {term} in {topic} is correct? [{tag}-{index + 1}]",
+                "options": options,
+                "correct_answer": "ABCD"[rng.randrange(4)],
+                "explanation": f"Option {options[0]} is a distractor; the correct option describes {term}.",
+            })
+        if as_json:
+            return json.dumps(questions)
+        blocks = []
+        for index, question in enumerate(questions, 1):
+            lines = [f"{index}. {question['question']}"]
+            lines += [f"{letter}. {option}" for letter, option in zip("ABCD", question["options"])]
+            lines += [f"Answer: {question['correct_answer']}", f"Explanation: {question['explanation']}"]
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    def _tutor_response(self, rng: random.Random) -> str:
+        words = [rng.choice(_FAKE_VOCABULARY) for _ in range(self.response_tokens)]
+        paragraphs = [" ".join(words[start:start + 40]) + "." for start in range(0, len(words), 40)]
+        return "\n\n".join(paragraphs)
+
+    def _record_usage(self, prompt: str, system: Optional[str], text: str) -> int:
+        """
+        Count the call's tokens and return how many input tokens were not cached
+        """
+        input_tokens = estimate_tokens(prompt)
+        cached_tokens = 0
+        if system is not None:
+            system_tokens = estimate_tokens(system)
+            if system in self._cached_prefixes:
+                cached_tokens = system_tokens
+            elif system_tokens >= self.min_cache_tokens:
+                self._cached_prefixes.add(system)
+            input_tokens += system_tokens
+        LLM_TOKENS.inc(input_tokens, provider=self.name, direction="input")
+        if cached_tokens:
+            LLM_TOKENS.inc(cached_tokens, provider=self.name, direction="cached_input")
+        LLM_TOKENS.inc(estimate_tokens(text), provider=self.name, direction="output")
+        return input_tokens - cached_tokens
+
+    def render(self, prompt: str, system: Optional[str] = None) -> str:
+        """
+        Return the deterministic response text for a prompt, without latency or failures
+        """
+        rng = random.Random(f"{self.seed}:{prompt}")
+        match = _QUIZ_REQUEST_RE.search(prompt)
+        if match:
+            return self._quiz_response(rng, match, as_json='"correct_answer"' in (system or "") + prompt)
+        return self._tutor_response(rng)
+
+    def invoke(self, prompt: str, system: Optional[str] = None) -> str:
+        self._maybe_fail()
+        text = self.render(prompt, system)
+        uncached = self._record_usage(prompt, system, text)
+        time.sleep(self._first_token_latency(uncached) + self._generation_time(text))
+        return text
+
+    async def ainvoke(self, prompt: str, system: Optional[str] = None) -> str:
+        self._maybe_fail()
+        text = self.render(prompt, system)
+        uncached = self._record_usage(prompt, system, text)
+        await asyncio.sleep(self._first_token_latency(uncached) + self._generation_time(text))
+        return text
+
+    async def astream(self, prompt: str, system: Optional[str] = None):
+        self._maybe_fail()
+        text = self.render(prompt, system)
+        uncached = self._record_usage(prompt, system, text)
+        words = text.split(" ")
+        await asyncio.sleep(self._first_token_latency(uncached))
+        # Emit a few tokens per chunk rather than sleeping once per token
+        for start in range(0, len(words), 8):
+            chunk = " ".join(words[start:start + 8])
+            if start + 8 < len(words):
+                chunk += " "
+            await asyncio.sleep(self._generation_time(chunk))
+            yield chunk
+
+
+def create_provider() -> LLMProvider:
+    """
+    Build the LLM provider selected by LLM_PROVIDER, recorded to or replayed
+    from a cassette when LLM_CASSETTE_MODE is set (see cassette.py)
+    """
+    from .cassette import wrap_provider
+
+    return wrap_provider(_create_base_provider)
+
+
+def _create_base_provider() -> LLMProvider:
+    """
+    Build the LLM provider selected by LLM_PROVIDER: "gemini" (default) or "fake"
+    """
+    provider_name = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if provider_name == "gemini":
+        # The client-side timeout bounds blocking calls that the async call policy cannot cancel
+        return GeminiProvider(
+            model=os.getenv("GEMINI_MODEL", "gemini-pro-latest"),
+            timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+        )
+    if provider_name == "fake":
+        return FakeProvider(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.5")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            response_tokens=int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "200")),
+            rate_limit_rate=float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+            slow_rate=float(os.getenv("FAKE_LLM_SLOW_RATE", "0")),
+            slow_latency=float(os.getenv("FAKE_LLM_SLOW_LATENCY", "10")),
+            prefill_tokens_per_second=float(os.getenv("FAKE_LLM_PREFILL_TOKENS_PER_SECOND", "0")),
+            min_cache_tokens=int(os.getenv("FAKE_LLM_MIN_CACHE_TOKENS", "1024")),
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider_name}")
@@ -0,0 +1,110 @@
+# src/ai_engine/quiz_bank.py
+# Persistent bank of parsed quiz questions per (topic, difficulty)
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from .shared_state import connect_sqlite, state_path
+
+# The fixed topic x difficulty grid offered by the Quiz Generator page
+QUIZ_TOPICS = ["DBMS", "OS", "CN", "AI", "ML", "DL", "System Design", "GenAI"]
+QUIZ_DIFFICULTIES = ["Beginner", "Intermediate", "Advanced"]
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def question_key(question: dict) -> str:
+    """
+    Hash of the normalized question text, used to deduplicate questions
+    """
+    text = _NON_WORD_RE.sub(" ", str(question.get("question", "")).lower()).strip()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pair(topic: str, difficulty: str) -> tuple[str, str]:
+    return topic.strip().lower(), difficulty.strip().lower()
+
+
+class QuizBank:
+    """
+    SQLite-backed store of quiz questions, deduplicated per (topic, difficulty)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_bank (
+                topic TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (topic, difficulty, question_key)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def add(self, topic: str, difficulty: str, questions: list[dict]) -> int:
+        """
+        Add complete questions to the bank, skipping duplicates. Returns how many were new.
+        """
+        topic_key, difficulty_key = _pair(topic, difficulty)
+        now = time.time()
+        rows = [
+            (topic_key, difficulty_key, question_key(q), json.dumps(q), now)
+            for q in questions
+            if q.get("question") and q.get("options") and q.get("correct_answer")
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO quiz_bank (topic, difficulty, question_key, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def count(self, topic: str, difficulty: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM quiz_bank WHERE topic = ? AND difficulty = ?",
+                _pair(topic, difficulty),
+            ).fetchone()[0]
+
+    def sample(self, topic: str, difficulty: str, num_questions: int) -> Optional[list[dict]]:
+        """
+        Return num_questions random questions, or None if the bank has too few
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM quiz_bank WHERE topic = ? AND difficulty = ? ORDER BY RANDOM() LIMIT ?",
+                (*_pair(topic, difficulty), num_questions),
+            ).fetchall()
+        if len(rows) < num_questions:
+            return None
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic, difficulty, COUNT(*) FROM quiz_bank GROUP BY topic, difficulty"
+            ).fetchall()
+        return {f"{topic}/{difficulty}": count for topic, difficulty, count in rows}
+
+
+def create_quiz_bank() -> Optional[QuizBank]:
+    """
+    Build the quiz bank from environment settings, or None if QUIZ_BANK_ENABLED is false
+    """
+    if os.getenv("QUIZ_BANK_ENABLED", "true").lower() != "true":
+        return None
+    return QuizBank(os.getenv("QUIZ_BANK_PATH", state_path("quiz_bank.sqlite3")))
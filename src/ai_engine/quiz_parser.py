@@ -0,0 +1,126 @@
+# src/ai_engine/quiz_parser.py
+# Single-pass parser for LLM-generated multiple-choice quizzes
+
+from dataclasses import asdict, dataclass, field
+import re
+
+# One compiled pattern classifies every line. Alternatives are tried in order,
+# so answer/explanation labels win over option letters ("Answer:" starts with A).
+# Option letters must be followed by whitespace, so prose such as "E.g." is
+# not taken for an option; options are only read before the answer line.
+_LINE_RE = re.compile(
+    r"""
+    ^(?:
+        (?:correct\s+answer|answer|correct)\s*[:\-]\s*(?P<answer>.*)
+      | explanation\s*[:\-]\s*(?P<explanation>.*)
+      | \(?(?P<letter>[A-F])\s*[.):](?=\s|$)\s*(?P<option>.*)
+      | (?:q(?:uestion)?\s*\d*\s*[:.)]|(?P<number>\d+)\s*[.):])\s*(?P<question>.*)
+    )$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+# Markdown decoration LLMs like to add: bold/italics markers, headings, bullets
+_DECORATION_RE = re.compile(r"\*\*|__|^#+\s*|^[-*]\s+(?=\S)")
+
+# Answer text such as "B", "(B)", "B) To manage..." or "Option B"
+_ANSWER_LETTER_RE = re.compile(r"^(?:option\s+)?\(?([A-Fa-f])\b(?:\s*[.):]|\s*$)", re.IGNORECASE)
+
+_QUESTION, _OPTIONS, _ANSWER, _EXPLANATION, _DONE = range(5)
+
+
+@dataclass
+class QuizQuestion:
+    """
+    A parsed multiple-choice question in the shape the frontend consumes
+    """
+
+    question: str
+    options: list[str] = field(default_factory=list)
+    correct_answer: str = ""
+    explanation: str = ""
+
+    @property
+    def is_complete(self) -> bool:
+        return bool(self.question and len(self.options) >= 2 and self.correct_answer)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def normalize_answer(answer: str) -> str:
+    """
+    Reduce an answer line to its option letter when it names one
+    """
+    match = _ANSWER_LETTER_RE.match(answer.strip())
+    return match.group(1).upper() if match else answer.strip()
+
+
+def strip_option_label(option: str) -> str:
+    """
+    Remove a leading option label such as "A.", "B)" or "(C)" from option text
+    """
+    match = _LINE_RE.match(option.strip())
+    if match and match.lastgroup == "option":
+        return match.group("option").strip()
+    return option.strip()
+
+
+def parse_quiz(content: str) -> list[QuizQuestion]:
+    """
+    Parse quiz text into questions in a single pass over its lines.
+
+    Recognizes numbered ("1.", "1)"), "Q:"/"Q1." and "Question 1:" headers,
+    "A.", "A)", "A:" and "(A)" options, "Answer:"/"Correct Answer:" lines and
+    "Explanation:" lines. Unlabelled lines continue the current question text
+    or explanation; a blank line ends the explanation. Inside an explanation a
+    numbered line only starts a new question when it carries the next question
+    number and does not continue a numbered list already in the explanation,
+    so lists in explanations stay part of them. Text before the first question
+    header and after the last explanation is ignored, and questions without a
+    question text, two options and an answer are dropped.
+    """
+    questions: list[QuizQuestion] = []
+    current = None
+    state = _QUESTION
+    # Next item number of a numbered list inside the current explanation
+    list_next = 0
+
+    for raw_line in content.splitlines():
+        line = _DECORATION_RE.sub("", raw_line).strip()
+        if not line:
+            if state == _EXPLANATION:
+                state = _DONE
+            continue
+
+        match = _LINE_RE.match(line)
+        group = match.lastgroup if match else None
+
+        number = int(match.group("number")) if group == "question" and match.group("number") else None
+        if state == _EXPLANATION and number is not None and (number == list_next or number != len(questions) + 1):
+            current.explanation = f"{current.explanation} {line}".strip()
+            list_next = number + 1
+        elif group == "question":
+            current = QuizQuestion(question=match.group("question").strip())
+            questions.append(current)
+            state = _QUESTION
+        elif current is None:
+            continue
+        elif group == "option" and state in (_QUESTION, _OPTIONS):
+            current.options.append(match.group("option").strip())
+            state = _OPTIONS
+        elif group == "answer":
+            current.correct_answer = normalize_answer(match.group("answer"))
+            state = _ANSWER
+        elif group == "explanation":
+            current.explanation = match.group("explanation").strip()
+            list_next = 0
+            state = _EXPLANATION
+        elif state == _QUESTION:
+            current.question = f"{current.question} {line}".strip()
+        elif state == _EXPLANATION:
+            current.explanation = f"{current.explanation} {line}".strip()
+        elif state == _ANSWER and not current.correct_answer:
+            current.correct_answer = normalize_answer(line)
+
+    return [question for question in questions if question.is_complete]
@@ -0,0 +1,119 @@
+# src/ai_engine/quiz_schema.py
+# JSON schema, validation and repair for structured-output quiz generation
+
+import json
+import re
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .quiz_parser import QuizQuestion, normalize_answer, strip_option_label
+
+_CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_ANSWER_LETTER_RE = re.compile(r"^[A-F]$")
+
+# Keys models sometimes use instead of the schema's field names
+_FIELD_ALIASES = {
+    "question": ("question", "question_text", "prompt", "text"),
+    "options": ("options", "choices", "answers"),
+    "correct_answer": ("correct_answer", "answer", "correct", "correct_option"),
+    "explanation": ("explanation", "rationale", "reason"),
+}
+
+
+class QuizItem(BaseModel):
+    """
+    Schema of one quiz question, matching the dict the frontend consumes
+    """
+
+    question: str = Field(min_length=1)
+    options: list[str] = Field(min_length=2, max_length=6)
+    correct_answer: str = Field(pattern=r"^[A-F]$", description="Letter of the correct option")
+    explanation: str = ""
+
+
+QUIZ_JSON_SCHEMA = json.dumps(
+    {"type": "array", "items": QuizItem.model_json_schema()}, indent=2
+)
+
+
+def _field(item: dict, name: str):
+    for key in _FIELD_ALIASES[name]:
+        if key in item:
+            return item[key]
+    return None
+
+
+def repair_quiz_item(item: dict) -> Optional[QuizQuestion]:
+    """
+    Coerce a decoded question object into a valid QuizQuestion, or None if it cannot be repaired
+    """
+    if not isinstance(item, dict):
+        return None
+
+    options = _field(item, "options") or []
+    if isinstance(options, dict):
+        # {"A": "...", "B": "..."} -> ordered list
+        options = [options[key] for key in sorted(options)]
+    options = [strip_option_label(str(option)) for option in options if str(option).strip()]
+
+    answer = normalize_answer(str(_field(item, "correct_answer") or ""))
+    if not _ANSWER_LETTER_RE.match(answer):
+        # The model quoted the option text instead of its letter
+        stripped = strip_option_label(answer).lower()
+        for index, option in enumerate(options):
+            if option.lower() == stripped:
+                answer = chr(ord("A") + index)
+                break
+
+    try:
+        validated = QuizItem(
+            question=str(_field(item, "question") or "").strip(),
+            options=options,
+            correct_answer=answer,
+            explanation=str(_field(item, "explanation") or "").strip(),
+        )
+    except ValidationError:
+        return None
+    if ord(validated.correct_answer) - ord("A") >= len(validated.options):
+        return None
+    return QuizQuestion(**validated.model_dump())
+
+
+def parse_quiz_json(content: str) -> list[QuizQuestion]:
+    """
+    Decode quiz questions from model JSON output.
+
+    Objects are decoded one at a time, so a truncated or partly malformed
+    array still yields every complete question before the damage. Items
+    that fail validation after repair are dropped.
+    """
+    text = _CODE_FENCE_RE.sub("", content.strip())
+    decoder = json.JSONDecoder()
+
+    # Accept a bare array or an object wrapping one, e.g. {"questions": [...]}
+    start = text.find("[")
+    if start < 0:
+        return []
+
+    questions = []
+    position = start + 1
+    while position < len(text):
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] == "]":
+            break
+        if text[position] != "{":
+            # Skip stray tokens up to the next object
+            position = text.find("{", position)
+            if position < 0:
+                break
+            continue
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        question = repair_quiz_item(item)
+        if question is not None:
+            questions.append(question)
+    return questions
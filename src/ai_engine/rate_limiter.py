@@ -0,0 +1,289 @@
+# src/ai_engine/rate_limiter.py
+# Adaptive admission control for upstream LLM calls
+
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .shared_state import aget_shared_value, aset_shared_value
+
+_RATE_LIMIT_MARKERS = ("429", "resource exhausted", "resource_exhausted", "rate limit", "quota")
+
+
+class AdmissionError(Exception):
+    """
+    An LLM call was not started. Carries the HTTP status the backend should
+    return and how many seconds the client should wait before retrying.
+    The message may contain upstream error text and is only logged; clients
+    get the fixed client_message.
+    """
+
+    status_code = 503
+    client_message = "The tutor cannot take this request right now"
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class UpstreamRateLimitError(AdmissionError):
+    """
+    The LLM provider is rejecting calls for quota or rate reasons
+    """
+
+    status_code = 429
+    client_message = "The LLM provider is rate limiting requests"
+
+
+class EngineOverloadedError(AdmissionError):
+    """
+    Too many calls are queued, or a call could not start before its queue deadline
+    """
+
+    status_code = 503
+    client_message = "The tutor is busy"
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Whether an upstream exception is an HTTP 429 / quota rejection.
+    Gemini surfaces these as ResourceExhausted errors, possibly wrapped by LangChain.
+    """
+    if isinstance(error, UpstreamRateLimitError):
+        return True
+    for attribute in ("status_code", "code"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket plus concurrency cap in front of the LLM provider.
+
+    Calls wait in a bounded queue for a concurrency slot and a rate token,
+    and are rejected with EngineOverloadedError if they cannot start within
+    queue_timeout seconds. When the provider answers with a 429 the allowed
+    rate is halved and new calls pause for an exponentially growing,
+    jittered backoff; calls that cannot outlast the pause fail fast with
+    UpstreamRateLimitError. Successful calls raise the rate again step by
+    step until the configured ceiling (or no limit) is restored.
+
+    The pause is also written to the shared state store, so every worker
+    backs off when one of them is rate limited. The concurrency cap and the
+    token bucket are kept per worker process; create_limiter divides the
+    configured rate and burst among the workers.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_second: float = 0.0, burst: int = None,
+                 queue_timeout: float = 30.0, max_queue: int = 100, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, min_rate: float = 0.1, shared_name: Optional[str] = None):
+        self.max_concurrency = max_concurrency
+        self.ceiling = requests_per_second or None
+        self.rate = self.ceiling
+        self.burst = burst or max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_rate = min_rate
+        self.shared_name = shared_name
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._shared_checked_at = 0.0
+        self._recovery_target: Optional[float] = None
+        self._consecutive_rate_limits = 0
+        self._recent_starts: deque[float] = deque()
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_overloaded = 0
+        self.rejected_rate_limited = 0
+        self.upstream_rate_limits = 0
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _pause_remaining(self, now: float) -> float:
+        """
+        Seconds left in the current backoff pause, as last seen from the shared state store
+        """
+        return max(0.0, self._paused_until - now)
+
+    async def _sync_shared_pause(self, now: float):
+        """
+        Adopt a longer pause set by another worker; the store is read at most once a second
+        """
+        if self.shared_name and now - self._shared_checked_at >= 1.0:
+            self._shared_checked_at = now
+            shared_until = await aget_shared_value(f"{self.shared_name}:paused_until")
+            if shared_until is not None:
+                self._paused_until = max(self._paused_until, now + float(shared_until) - time.time())
+
+    def _observed_rate(self, now: float) -> float:
+        """
+        Calls started per second over the last 10 seconds
+        """
+        while self._recent_starts and self._recent_starts[0] < now - 10:
+            self._recent_starts.popleft()
+        return len(self._recent_starts) / 10
+
+    async def _wait_for_start(self, deadline: float):
+        """
+        Wait until the backoff pause is over and a rate token is available
+        """
+        while True:
+            now = time.monotonic()
+            await self._sync_shared_pause(now)
+            pause = self._pause_remaining(now)
+            if pause > 0:
+                if now + pause > deadline:
+                    self.rejected_rate_limited += 1
+                    raise UpstreamRateLimitError("The LLM provider is rate limiting requests", retry_after=pause)
+                await asyncio.sleep(pause)
+                continue
+            self._refill(now)
+            if self.rate is None or self._tokens >= 1:
+                if self.rate is not None:
+                    self._tokens -= 1
+                return
+            wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                self.rejected_overloaded += 1
+                raise EngineOverloadedError("Too many LLM requests queued", retry_after=wait)
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Admit one upstream call, and adapt the rate to how the call ends
+        """
+        now = time.monotonic()
+        await self._sync_shared_pause(now)
+        pause = self._pause_remaining(now)
+        if pause > self.queue_timeout:
+            self.rejected_rate_limited += 1
+            raise UpstreamRateLimitError("The LLM provider is rate limiting requests", retry_after=pause)
+        if self.waiting >= self.max_queue:
+            self.rejected_overloaded += 1
+            raise EngineOverloadedError("Too many LLM requests queued", retry_after=max(pause, 1.0))
+
+        deadline = now + self.queue_timeout
+        self.waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_overloaded += 1
+                raise EngineOverloadedError("Too many LLM requests queued", retry_after=self.queue_timeout) from None
+            try:
+                await self._wait_for_start(deadline)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.in_flight += 1
+        self._recent_starts.append(time.monotonic())
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.record_rate_limited()
+                if self.shared_name:
+                    await aset_shared_value(f"{self.shared_name}:paused_until",
+                                            time.time() + self._pause_remaining(time.monotonic()))
+                raise UpstreamRateLimitError(
+                    f"The LLM provider is rate limiting requests: {e}",
+                    retry_after=self._pause_remaining(time.monotonic()),
+                ) from e
+            raise
+        else:
+            self.record_success()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def record_rate_limited(self):
+        """
+        Multiplicative decrease: halve the rate and pause with jittered exponential backoff
+        """
+        now = time.monotonic()
+        self.upstream_rate_limits += 1
+        self._consecutive_rate_limits += 1
+        # Without a configured rate, start from recent traffic (at least one call per second)
+        current = self.rate if self.rate is not None else max(self._observed_rate(now), 1.0)
+        if self._recovery_target is None:
+            self._recovery_target = current
+        self.rate = max(self.min_rate, current / 2)
+        self._tokens = min(self._tokens, 0.0)
+
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_rate_limits - 1))
+        backoff *= random.uniform(0.5, 1.0)
+        self._paused_until = max(self._paused_until, now + backoff)
+
+    def record_success(self):
+        """
+        Additive increase back towards the rate in effect before the last 429
+        """
+        self._consecutive_rate_limits = 0
+        if self._recovery_target is None or self.rate is None:
+            return
+        self.rate += self._recovery_target / 20
+        if self.rate >= self._recovery_target:
+            self.rate = self.ceiling
+            self._recovery_target = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "rate_limit_per_second": self.rate,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "paused_for": round(self._pause_remaining(now), 3),
+            "admitted": self.admitted,
+            "rejected_overloaded": self.rejected_overloaded,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "upstream_rate_limits": self.upstream_rate_limits,
+        }
+
+
+def create_limiter(max_concurrency: int) -> AdaptiveLimiter:
+    """
+    Build the upstream limiter from environment settings.
+    LLM_REQUESTS_PER_SECOND and LLM_BURST are budgets for the whole host, so
+    with WEB_CONCURRENCY workers each one gets its share; max_concurrency is
+    per worker. Backoff pauses are shared through the state store when
+    several workers run.
+    """
+    burst = os.getenv("LLM_BURST")
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return AdaptiveLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_second=float(os.getenv("LLM_REQUESTS_PER_SECOND", "0")) / workers,
+        burst=max(1, int(burst) // workers) if burst else None,
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "1")),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "60")),
+        shared_name="llm-rate-limit" if workers > 1 else None,
+    )
@@ -0,0 +1,241 @@
+# src/ai_engine/response_cache.py
+# Response cache for tutor answers, keyed on normalized (query, style)
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from .shared_state import connect_sqlite, state_path
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s?.!]+$")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text so trivially different phrasings share a cache entry
+    """
+    text = _WHITESPACE_RE.sub(" ", query.strip().lower())
+    return _TRAILING_PUNCTUATION_RE.sub("", text)
+
+
+def make_cache_key(query: str, style: str) -> str:
+    """
+    Build the cache key for a (query, style) pair
+    """
+    raw = f"{style.strip().lower()}\x1f{normalize_query(query)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with per-entry expiry
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk cache stored in SQLite so entries survive restarts and are shared
+    by all worker processes. Eviction is LRU by last access time once
+    max_entries is exceeded.
+
+    Reads never write: access times of hits are batched in memory and written
+    with the next set(), or at most every touch_interval seconds, so a cache
+    hit does not take the database write lock. Expired rows are purged by set().
+    """
+
+    # Calls may wait on other workers' writes; ResponseCache runs them off the event loop
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000, touch_interval: float = 30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+        self._touches_written_at = time.monotonic()
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            self._touched[key] = now
+            if time.monotonic() - self._touches_written_at >= self.touch_interval:
+                self._write_touches()
+                self._conn.commit()
+            return row[0]
+
+    def _write_touches(self):
+        """
+        Write the batched access times; the caller holds the lock and commits
+        """
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE response_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touches_written_at = time.monotonic()
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._write_touches()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                """
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Cache of generated tutor responses with hit/miss counters.
+    The storage backend is pluggable: anything with get/set/clear/__len__ works.
+    Backends with a true `blocking` attribute are called from a worker thread
+    by the async aget/aset.
+    """
+
+    def __init__(self, backend, ttl: float = 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get(self, query: str, style: str) -> Optional[str]:
+        return self._count(self.backend.get(make_cache_key(query, style)))
+
+    def set(self, query: str, style: str, response: str):
+        self.backend.set(make_cache_key(query, style), response, self.ttl)
+
+    async def aget(self, query: str, style: str) -> Optional[str]:
+        key = make_cache_key(query, style)
+        if getattr(self.backend, "blocking", False):
+            return self._count(await asyncio.to_thread(self.backend.get, key))
+        return self._count(self.backend.get(key))
+
+    async def aset(self, query: str, style: str, response: str):
+        key = make_cache_key(query, style)
+        if getattr(self.backend, "blocking", False):
+            await asyncio.to_thread(self.backend.set, key, response, self.ttl)
+        else:
+            self.backend.set(key, response, self.ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the response cache from environment settings.
+    RESPONSE_CACHE_BACKEND is "memory", "sqlite" or "none". It defaults to
+    "sqlite" when the backend runs several workers (WEB_CONCURRENCY > 1) so
+    they share one cache, and to "memory" otherwise.
+    """
+    default_backend = "sqlite" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "memory"
+    backend_name = os.getenv("RESPONSE_CACHE_BACKEND", default_backend).lower()
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        path = os.getenv("RESPONSE_CACHE_PATH", state_path("response_cache.sqlite3"))
+        backend = SQLiteCacheBackend(path, max_entries=max_entries)
+    elif backend_name == "memory":
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend_name}")
+    return ResponseCache(backend, ttl=ttl)
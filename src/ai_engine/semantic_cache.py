@@ -0,0 +1,200 @@
+# src/ai_engine/semantic_cache.py
+# Similarity cache that serves tutor answers for paraphrased questions
+
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Question scaffolding that says nothing about the topic being asked about
+_STOPWORDS = frozenset(
+    "a an and are about can concept define definition describe difference does explain explanation "
+    "for give how i in is it me of on please tell the to topic understand what whats with work works".split()
+)
+
+# Course abbreviations students use interchangeably with the full terms
+_EXPANSIONS = {
+    "oop": "object oriented programming",
+    "oops": "object oriented programming",
+    "dbms": "database management system",
+    "rdbms": "relational database management system",
+    "db": "database",
+    "os": "operating system",
+    "cn": "computer network",
+    "ai": "artificial intelligence",
+    "ml": "machine learning",
+    "dl": "deep learning",
+    "genai": "generative ai",
+    "dsa": "data structure algorithm",
+    "ds": "data structure",
+}
+
+
+def _stem(word: str) -> str:
+    """
+    Crude plural folding so "databases" and "database" share features
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+class HashedNgramEmbedder:
+    """
+    Embed text as an L2-normalized vector of hashed, weighted word, word-bigram
+    and character n-gram features. Words dominate; character n-grams add
+    tolerance for typos and word forms. CPU-only, no model download, and
+    stable across processes (crc32, not hash()).
+    """
+
+    def __init__(self, dim: int = 1024, char_ngrams: tuple[int, ...] = (3, 4),
+                 word_weight: float = 1.0, bigram_weight: float = 0.5, char_weight: float = 0.1):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.word_weight = word_weight
+        self.bigram_weight = bigram_weight
+        self.char_weight = char_weight
+
+    def _words(self, text: str) -> list[str]:
+        words = []
+        for token in _TOKEN_RE.findall(text.lower()):
+            for word in _EXPANSIONS.get(token, token).split():
+                if word not in _STOPWORDS:
+                    words.append(_stem(word))
+        return words
+
+    def _features(self, text: str) -> list[tuple[str, float]]:
+        words = self._words(text)
+        features = [(f"w:{word}", self.word_weight) for word in words]
+        features += [(f"b:{first} {second}", self.bigram_weight) for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            for n in self.char_ngrams:
+                features += [(f"c:{padded[i:i + n]}", self.char_weight) for i in range(len(padded) - n + 1)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            vector[zlib.crc32(feature.encode("utf-8")) % self.dim] += weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _StyleIndex:
+    """
+    Fixed-capacity matrix of query vectors for one response style
+    """
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.responses: list[Optional[str]] = [None] * capacity
+        self.size = 0
+
+    def slot_for_insert(self, now: float) -> int:
+        """
+        Next free slot, else an expired one, else the least recently used
+        """
+        if self.size < len(self.responses):
+            self.size += 1
+            return self.size - 1
+        expired = np.flatnonzero(self.expires_at < now)
+        if expired.size:
+            return int(expired[0])
+        return int(np.argmin(self.last_used))
+
+
+class SemanticCache:
+    """
+    Cache of tutor responses looked up by query similarity, per style.
+
+    Memory is bounded by max_entries_per_style rows of dim float32 values for
+    each style; when an index is full, expired rows are reused first and then
+    the least recently used row is evicted.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries_per_style: int = 2000,
+                 ttl: float = 86400, embedder: HashedNgramEmbedder = None):
+        self.threshold = threshold
+        self.max_entries_per_style = max_entries_per_style
+        self.ttl = ttl
+        self.embedder = embedder or HashedNgramEmbedder()
+        self._indexes: dict[str, _StyleIndex] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, query: str, style: str) -> Optional[str]:
+        vector = self.embedder.embed(query)
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(style)
+            if index is None or index.size == 0 or not vector.any():
+                self.misses += 1
+                return None
+            scores = index.vectors[:index.size] @ vector
+            scores[index.expires_at[:index.size] < now] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            index.last_used[best] = now
+            self.hits += 1
+            return index.responses[best]
+
+    def set(self, query: str, style: str, response: str):
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(style)
+            if index is None:
+                index = self._indexes[style] = _StyleIndex(self.max_entries_per_style, self.embedder.dim)
+            full = index.size == len(index.responses)
+            slot = index.slot_for_insert(now)
+            if full and index.expires_at[slot] >= now:
+                self.evictions += 1
+            index.vectors[slot] = vector
+            index.expires_at[slot] = now + self.ttl
+            index.last_used[slot] = now
+            index.responses[slot] = response
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = {style: index.size for style, index in self._indexes.items()}
+        return {
+            "threshold": self.threshold,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """
+    Build the semantic cache from environment settings, or None unless SEMANTIC_CACHE_ENABLED is true.
+    It is off by default: the vectors are lexical, so questions that share most of
+    their words but differ in meaning (best vs worst case) can score above the threshold.
+    """
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    return SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+        max_entries_per_style=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+    )
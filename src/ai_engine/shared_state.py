@@ -0,0 +1,116 @@
+# src/ai_engine/shared_state.py
+# Local on-disk state shared by all backend worker processes on a host
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+_conn: Optional[sqlite3.Connection] = None
+_conn_pid: Optional[int] = None
+_conn_lock = threading.Lock()
+
+
+def state_path(filename: str) -> str:
+    """
+    Path of a state file inside AI_TUTOR_STATE_DIR (default .cache)
+    """
+    return os.path.join(os.getenv("AI_TUTOR_STATE_DIR", ".cache"), filename)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database that several worker processes can use at once.
+    WAL mode lets readers proceed during writes, and the busy timeout makes
+    writers wait for each other instead of failing with "database is locked".
+    The busy wait blocks the calling thread, so code on the event loop should
+    reach these connections through asyncio.to_thread.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _shared_conn() -> sqlite3.Connection:
+    """
+    This process's connection to the shared state store, opened once.
+    Callers hold _conn_lock while using it.
+    """
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = connect_sqlite(state_path("shared_state.sqlite3"))
+        _conn_pid = os.getpid()
+        _conn.execute("CREATE TABLE IF NOT EXISTS claims (name TEXT PRIMARY KEY, owner INTEGER, expires_at REAL)")
+        _conn.execute("CREATE TABLE IF NOT EXISTS shared_values (name TEXT PRIMARY KEY, value REAL)")
+        _conn.commit()
+    return _conn
+
+
+def claim_once(name: str, ttl: float) -> bool:
+    """
+    Claim a named piece of work for this process across all workers.
+    Returns True for exactly one caller until the claim is released or ttl expires.
+    """
+    now = time.time()
+    with _conn_lock:
+        conn = _shared_conn()
+        with conn:
+            conn.execute("DELETE FROM claims WHERE name = ? AND expires_at < ?", (name, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO claims (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, os.getpid(), now + ttl),
+            )
+        return cursor.rowcount == 1
+
+
+def release_claim(name: str):
+    """
+    Release a claim held by this process
+    """
+    with _conn_lock:
+        conn = _shared_conn()
+        with conn:
+            conn.execute("DELETE FROM claims WHERE name = ? AND owner = ?", (name, os.getpid()))
+
+
+def set_shared_value(name: str, value: float):
+    """
+    Publish a numeric value to all workers
+    """
+    with _conn_lock:
+        conn = _shared_conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO shared_values (name, value) VALUES (?, ?)", (name, value))
+
+
+def get_shared_value(name: str) -> Optional[float]:
+    """
+    Read a value published by any worker, or None if it was never set
+    """
+    with _conn_lock:
+        row = _shared_conn().execute("SELECT value FROM shared_values WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+# Variants for the event loop: the store is shared with other processes, so a
+# call may wait on their writes and must not block the loop while it does
+
+async def aclaim_once(name: str, ttl: float) -> bool:
+    return await asyncio.to_thread(claim_once, name, ttl)
+
+
+async def arelease_claim(name: str):
+    await asyncio.to_thread(release_claim, name)
+
+
+async def aset_shared_value(name: str, value: float):
+    await asyncio.to_thread(set_shared_value, name, value)
+
+
+async def aget_shared_value(name: str) -> Optional[float]:
+    return await asyncio.to_thread(get_shared_value, name)
@@ -0,0 +1,126 @@
+# src/ai_engine/singleflight.py
+# Request coalescing: concurrent identical calls share one in-flight upstream call
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Optional
+
+
+class _Broadcast:
+    """
+    Chunks of one upstream stream, replayed from the start to every follower
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._updated = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def close(self, error: Optional[BaseException] = None):
+        self.finished = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def follow(self):
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._updated.wait()
+
+
+class SingleFlight:
+    """
+    Collapse concurrent async calls with the same key into one execution.
+
+    The first caller for a key starts the work; callers that arrive while it
+    is running await the same task and receive its result or exception.
+    The shared task is shielded, so one caller giving up does not cancel it
+    for the others.
+
+    Streams are collapsed the same way: the first streamer starts one
+    background task that reads the upstream stream, and every concurrent
+    streamer with the key receives all of its chunks. Plain callers joining
+    a stream in flight receive its chunks combined into one result.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._streams: dict[Hashable, _Broadcast] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable]):
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, open_stream: Callable[[], AsyncIterator],
+                     combine: Callable[[list], object]):
+        """
+        Yield the chunks of open_stream(), read once for all concurrent
+        streamers with this key. combine(chunks) is the result handed to
+        plain callers of do() for the same key. If a plain call is
+        already in flight for the key, its result is yielded as one chunk.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            broadcast = _Broadcast()
+            task = asyncio.ensure_future(self._pump(open_stream, broadcast, combine))
+            self._in_flight[key] = task
+            self._streams[key] = broadcast
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.collapsed += 1
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                yield await asyncio.shield(task)
+                return
+        async for chunk in broadcast.follow():
+            yield chunk
+
+    @staticmethod
+    async def _pump(open_stream: Callable[[], AsyncIterator], broadcast: _Broadcast, combine: Callable[[list], object]):
+        try:
+            async for chunk in open_stream():
+                broadcast.publish(chunk)
+        except BaseException as e:
+            broadcast.close(e)
+            raise
+        broadcast.close()
+        return combine(broadcast.chunks)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._streams.pop(key, None)
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "upstream_calls": self.calls,
+            "collapsed_calls": self.collapsed,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,126 @@
+# src/ai_engine/structured_logging.py
+# JSON logging through a background queue, with request correlation IDs and sampling
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Optional
+
+# Correlation ID of the request being handled, and whether its routine logs are kept
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+request_sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("request_sampled", default=True)
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RESERVED_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, request_id,
+    any extra= fields, and the exception type and traceback if present
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRIBUTES and key not in ("request_id", "sampled"):
+                entry[key] = value
+        if record.exc_text:
+            entry["traceback"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Attach the current request ID to records and drop routine records of
+    unsampled requests. Warnings and errors are always kept.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.sampled = request_sampled_var.get()
+        return record.levelno >= logging.WARNING or record.sampled
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records with their message and traceback rendered to text, and
+    leave the (JSON) formatting to the listener thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.error_type = record.exc_info[0].__name__
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def new_request_context(request_id: Optional[str] = None) -> str:
+    """
+    Start a request's logging context: set its correlation ID (generated when
+    not supplied) and decide whether its routine logs are sampled in
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    request_sampled_var.set(random.random() < float(os.getenv("LOG_SAMPLE_RATE", "1.0")))
+    return request_id
+
+
+def configure_logging():
+    """
+    Route all logging through a queue drained by a background thread, so
+    request handlers never block on writing to stdout. LOG_LEVEL sets the
+    level, LOG_FORMAT is "json" (default) or "text", and LOG_SAMPLE_RATE is
+    the fraction of requests whose info-level logs are kept.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # Filter before enqueueing: the context variables are only visible on the calling side
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # Send uvicorn's own logs through the same queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
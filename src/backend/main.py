@@ -1,11 +1,18 @@
 # src/backend/main.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
-from typing import Dict, Any
+from typing import Dict, Any, Literal
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
 import os
+import signal
 import sys
-import traceback
+import threading
+import time
 
 # Load environment variables from .env file
 try:
@@ -17,16 +24,100 @@ except ImportError:
 # Add parent directory to sys.path to resolve ai_engine module import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-app = FastAPI()
+# Structured JSON logs written by a background thread (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+from ai_engine.structured_logging import configure_logging, new_request_context, request_id_var
+configure_logging()
+logger = logging.getLogger("backend")
+
+ENGINE_DRAIN_TIMEOUT = float(os.getenv("ENGINE_DRAIN_TIMEOUT", "30"))
+_shutdown_started = None
+
+def start_draining():
+    """
+    Report not-ready and stop claiming jobs; running jobs and LLM calls carry on
+    """
+    global _shutdown_started
+    if _shutdown_started is None:
+        _shutdown_started = time.monotonic()
+        logger.info("Shutdown signal received, draining")
+    begin_shutdown()
+    job_queue.stop_claiming()
+
+def watch_shutdown_signals():
+    """
+    Start draining as soon as SIGINT/SIGTERM arrives. uvicorn's own handler
+    (called afterwards) closes the listener and waits for open connections
+    before the lifespan shutdown runs, which is too late to start draining.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        def handle(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(start_draining)
+            if callable(previous):
+                previous(signum, frame)
+        signal.signal(sig, handle)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the engine and warm it up in the background so the server accepts
+    # connections immediately; /ready reports when the engine can serve
+    start_engine()
+    job_queue.start()
+    watch_shutdown_signals()
+    
+    # Optionally pre-generate the quiz bank for the topic x difficulty grid
+    prefill_task = None
+    if os.getenv("QUIZ_BANK_PREFILL", "false").lower() == "true":
+        prefill_task = asyncio.create_task(fill_quiz_bank())
+    yield
+    # Graceful shutdown: running jobs and in-flight LLM calls get until
+    # ENGINE_DRAIN_TIMEOUT after the shutdown signal to finish
+    start_draining()
+    if prefill_task is not None:
+        prefill_task.cancel()
+    deadline = _shutdown_started + ENGINE_DRAIN_TIMEOUT
+    await job_queue.stop(deadline - time.monotonic())
+    await drain(max(0.0, deadline - time.monotonic()))
+
+app = FastAPI(lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     query: str
     style: str  # "in_depth", "visual", "hands_on"
 
+# Upper bound on questions per quiz; large quizzes are generated in parallel batches
+QUIZ_MAX_QUESTIONS = int(os.environ.get("QUIZ_MAX_QUESTIONS", 20))
+
 class QuizRequest(BaseModel):
     topic: str
     difficulty: str
-    num_questions: int
+    num_questions: int = Field(ge=1, le=QUIZ_MAX_QUESTIONS)
+
+# Batch endpoints: at most BATCH_MAX_ITEMS items per request, BATCH_CONCURRENCY generated at a time
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 200))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+
+class BatchQueryRequest(BaseModel):
+    items: list[QueryRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class BatchQuizRequest(BaseModel):
+    items: list[QuizRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class QueryJobRequest(QueryRequest):
+    priority: Literal["low", "normal", "high"] = "normal"
+
+class QuizJobRequest(QuizRequest):
+    priority: Literal["low", "normal", "high"] = "normal"
+
+class QuizPrefetchRequest(BaseModel):
+    topic: str
+    difficulty: str
+    num_questions: int = Field(default=5, ge=1, le=QUIZ_MAX_QUESTIONS)
+    # Identifies the caller (e.g. a frontend session); its newer hints cancel older ones
+    client_id: str = Field(default="anonymous", max_length=64)
 
 class QueryResponse(BaseModel):
     response: str
@@ -34,49 +125,299 @@ class QueryResponse(BaseModel):
 class QuizResponse(BaseModel):
     questions: list[Dict[str, Any]]
 
-# Only use Google Gemini models
-print("Using Google Gemini models")
-from ai_engine.ai_engine_gemini import generate_ai_response as ai_generate_response, generate_quiz as ai_generate_quiz
+# Google Gemini by default; LLM_PROVIDER=fake runs fully offline
+logger.info("Using LLM provider", extra={"provider": os.getenv("LLM_PROVIDER", "gemini")})
+from ai_engine.ai_engine_gemini import agenerate_ai_response as ai_generate_response, agenerate_quiz as ai_generate_quiz, astream_ai_response as ai_stream_response, astream_quiz as ai_stream_quiz, begin_shutdown, drain, engine_status, fill_quiz_bank, aget_engine_stats, prefetch_quiz, start_engine
+from ai_engine.job_queue import create_job_queue
+from ai_engine.metrics import ERRORS, HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, render_metrics
+from ai_engine.rate_limiter import AdmissionError
+
+def admission_error(e: AdmissionError) -> HTTPException:
+    """
+    429 when the LLM provider is rate limiting, 503 when the engine queue is full,
+    with Retry-After so clients back off instead of timing out. The upstream
+    error is logged; the client gets a fixed message.
+    """
+    logger.warning("Request not admitted: %s", e, exc_info=e.__cause__, extra={"status": e.status_code})
+    ERRORS.inc(stage="admission", type=type(e).__name__)
+    return HTTPException(status_code=e.status_code, detail=e.client_message, headers={"Retry-After": e.retry_after_header})
+
+def generation_failed(stage: str) -> str:
+    """
+    Compact client-facing error message; the details are in the logs under the request ID
+    """
+    logger.exception("Error in %s", stage)
+    return f"Generation failed (request ID {request_id_var.get()})"
+
+async def run_response_job(payload: dict) -> dict:
+    return {"response": await ai_generate_response(payload["query"], payload["style"])}
+
+async def run_quiz_job(payload: dict) -> dict:
+    return {"questions": await ai_generate_quiz(payload["topic"], payload["difficulty"], payload["num_questions"])}
+
+# Queue for long generations submitted as jobs, shared by all worker processes
+job_queue = create_job_queue({"generate_response": run_response_job, "generate_quiz": run_quiz_job})
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    Per-request observability: a correlation ID (taken from X-Request-ID or
+    generated, and echoed back), latency by route template, the in-flight
+    gauge, and one access log line (sampled unless the request failed)
+    """
+    request_id = new_request_context(request.headers.get("X-Request-ID", "")[:64] or None)
+    started = time.perf_counter()
+    status = 500
+    with HTTP_IN_FLIGHT.track_in_progress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Request-ID"] = request_id
+            return response
+        finally:
+            duration = time.perf_counter() - started
+            route = request.scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(duration, endpoint=endpoint, method=request.method, status=status)
+            logger.log(
+                logging.WARNING if status >= 500 else logging.INFO, "Request handled",
+                extra={"method": request.method, "endpoint": endpoint, "status": status,
+                       "duration_ms": round(duration * 1000, 1)},
+            )
 
 @app.get("/")
 async def root():
     return {"message": "Agentic AI Tutor Backend is running"}
 
+@app.get("/health")
+async def health():
+    """
+    Liveness probe: the process is up and serving requests
+    """
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the AI engine can serve requests, 503 otherwise
+    """
+    status = engine_status()
+    if status["state"] != "ready":
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text format metrics for this worker process
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    return {**await aget_engine_stats(), "job_queue": await job_queue.stats()}
+
 @app.post("/generate_response", response_model=QueryResponse)
 async def generate_response(request: QueryRequest):
     try:
-        # Log the request for debugging
-        print(f"Received request: {request.query} with style {request.style}")
-        
         # This will be handled by the AI engine
-        result = ai_generate_response(request.query, request.style)
-        
-        print("Response generated successfully")
+        result = await ai_generate_response(request.query, request.style)
         return {"response": result}
+    except AdmissionError as e:
+        raise admission_error(e)
+    except Exception:
+        raise HTTPException(status_code=500, detail=generation_failed("generate_response"))
+
+@app.post("/generate_response/stream")
+async def generate_response_stream(request: QueryRequest):
+    """
+    Stream the tutor response as NDJSON: one {"chunk": ...} line per text chunk,
+    followed by {"done": true}, or {"error": ...} if generation fails midway.
+    The first chunk is awaited before responding, so a request that is not
+    admitted gets a 429/503 status instead of a 200 stream with an error line.
+    """
+    chunks = ai_stream_response(request.query, request.style)
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except AdmissionError as e:
+        raise admission_error(e)
     except Exception as e:
-        # Log the full error for debugging
-        error_details = f"Error in generate_response: {str(e)}\n{traceback.format_exc()}"
-        print(error_details)
-        raise HTTPException(status_code=500, detail=error_details)
+        first_chunk = e
+    request_id = request_id_var.get()
+    
+    async def ndjson_lines():
+        try:
+            if isinstance(first_chunk, Exception):
+                raise first_chunk
+            if first_chunk is not None:
+                yield json.dumps({"chunk": first_chunk}) + "\n"
+                async for chunk in chunks:
+                    yield json.dumps({"chunk": chunk}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        except Exception:
+            request_id_var.set(request_id)
+            yield json.dumps({"error": generation_failed("generate_response_stream")}) + "\n"
+        finally:
+            await chunks.aclose()
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 @app.post("/generate_quiz", response_model=QuizResponse)
 async def generate_quiz_endpoint(request: QuizRequest):
     try:
-        # Log the request for debugging
-        print(f"Received quiz request: {request.topic} ({request.difficulty}, {request.num_questions} questions)")
-        
         # This will be handled by the AI engine
-        result = ai_generate_quiz(request.topic, request.difficulty, request.num_questions)
-        
-        print(f"Quiz generated successfully with {len(result)} questions")
+        result = await ai_generate_quiz(request.topic, request.difficulty, request.num_questions)
         return {"questions": result}
+    except AdmissionError as e:
+        raise admission_error(e)
+    except Exception:
+        raise HTTPException(status_code=500, detail=generation_failed("generate_quiz"))
+
+@app.post("/generate_quiz/stream")
+async def generate_quiz_stream(request: QuizRequest):
+    """
+    Stream a quiz as NDJSON: one {"questions": [...]} line per batch of
+    questions as it is generated, followed by {"done": true}, or {"error": ...}
+    if generation fails midway. Like /generate_response/stream, the first
+    batch is awaited before responding so admission errors get a 429/503.
+    """
+    batches = ai_stream_quiz(request.topic, request.difficulty, request.num_questions)
+    try:
+        first_batch = await batches.__anext__()
+    except StopAsyncIteration:
+        first_batch = None
+    except AdmissionError as e:
+        raise admission_error(e)
     except Exception as e:
-        # Log the full error for debugging
-        error_details = f"Error in generate_quiz: {str(e)}\n{traceback.format_exc()}"
-        print(error_details)
-        raise HTTPException(status_code=500, detail=error_details)
+        first_batch = e
+    request_id = request_id_var.get()
+    
+    async def ndjson_lines():
+        try:
+            if isinstance(first_batch, Exception):
+                raise first_batch
+            if first_batch is not None:
+                yield json.dumps({"questions": first_batch}) + "\n"
+                async for batch in batches:
+                    yield json.dumps({"questions": batch}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        except Exception:
+            request_id_var.set(request_id)
+            yield json.dumps({"error": generation_failed("generate_quiz_stream")}) + "\n"
+        finally:
+            await batches.aclose()
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+async def run_batch(items: list, generate):
+    """
+    Run generate(item) for every item, at most BATCH_CONCURRENCY at a time, and
+    yield one NDJSON line per item as it completes, then a summary line.
+    Items go through the same caches and request coalescing as single requests.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_item(index: int, item):
+        async with semaphore:
+            try:
+                return {"index": index, "status": "ok", **await generate(item)}
+            except AdmissionError as e:
+                logger.warning("Batch item %d not admitted: %s", index, e, extra={"status": e.status_code})
+                return {"index": index, "status": "error", "status_code": e.status_code,
+                        "error": e.client_message, "retry_after": e.retry_after_header}
+            except Exception:
+                return {"index": index, "status": "error", "status_code": 500,
+                        "error": generation_failed(f"batch item {index}")}
+    
+    tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            succeeded += result["status"] == "ok"
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "succeeded": succeeded, "failed": len(items) - succeeded}) + "\n"
+    finally:
+        # The client went away: stop generating the remaining items
+        for task in tasks:
+            task.cancel()
+
+@app.post("/generate_response/batch")
+async def generate_response_batch(request: BatchQueryRequest):
+    """
+    Answer many tutor questions. Streams NDJSON in completion order: one
+    {"index", "status": "ok", "response"} or {"index", "status": "error",
+    "status_code", "error"} line per item, then {"done", "succeeded", "failed"}.
+    """
+    logger.info("Received batch of tutor questions", extra={"items": len(request.items)})
+    
+    async def generate(item: QueryRequest) -> dict:
+        return {"response": await ai_generate_response(item.query, item.style)}
+    
+    return StreamingResponse(run_batch(request.items, generate), media_type="application/x-ndjson")
+
+@app.post("/generate_quiz/batch")
+async def generate_quiz_batch(request: BatchQuizRequest):
+    """
+    Generate many quizzes, streamed as NDJSON like /generate_response/batch
+    with a "questions" list on each successful line
+    """
+    logger.info("Received batch of quiz requests", extra={"items": len(request.items)})
+    
+    async def generate(item: QuizRequest) -> dict:
+        return {"questions": await ai_generate_quiz(item.topic, item.difficulty, item.num_questions)}
+    
+    return StreamingResponse(run_batch(request.items, generate), media_type="application/x-ndjson")
+
+@app.post("/prefetch/quiz", status_code=202)
+async def prefetch_quiz_endpoint(request: QuizPrefetchRequest):
+    """
+    Low-priority hint that a quiz on (topic, difficulty) is likely to be requested
+    soon. Returns immediately; the quiz bank for the pair is filled in the
+    background only while upstream capacity is idle and within the prefetch budget.
+    """
+    return await prefetch_quiz(request.topic, request.difficulty, request.num_questions, request.client_id)
+
+async def submit_job(kind: str, request) -> JSONResponse:
+    try:
+        job = await job_queue.submit(kind, request.model_dump(exclude={"priority"}), request.priority)
+    except AdmissionError as e:
+        raise admission_error(e)
+    logger.info("Queued job", extra={"job_id": job["job_id"], "kind": kind, "priority": request.priority})
+    return JSONResponse(status_code=202, content=job, headers={"Location": f"/jobs/{job['job_id']}"})
+
+@app.post("/jobs/generate_response", status_code=202)
+async def submit_response_job(request: QueryJobRequest):
+    """
+    Queue a tutor response; returns the job record with its job_id immediately
+    """
+    return await submit_job("generate_response", request)
+
+@app.post("/jobs/generate_quiz", status_code=202)
+async def submit_quiz_job(request: QuizJobRequest):
+    """
+    Queue a quiz; returns the job record with its job_id immediately
+    """
+    return await submit_job("generate_quiz", request)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(default=0, ge=0, le=60)):
+    """
+    Job status, and its result once done. With wait > 0 the request is held
+    for up to that many seconds until the job finishes (long polling).
+    """
+    job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
 
 if __name__ == "__main__":
     # Get port from environment variable or default to 8000
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    # WEB_CONCURRENCY worker processes share caches and the quiz bank through AI_TUTOR_STATE_DIR
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    drain_timeout = int(float(os.environ.get("ENGINE_DRAIN_TIMEOUT", 30)))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False, workers=workers, access_log=False,
+                timeout_graceful_shutdown=drain_timeout + 5)
\ No newline at end of file
@@ -1,9 +1,15 @@
 # src/frontend/app.py
 import streamlit as st
+import html
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-from typing import Dict, List
+from typing import Dict, List, Optional
 import os
+import threading
+import time
+import uuid
 
 # Set page configuration
 st.set_page_config(page_title="Agentic AI Tutor", page_icon="🤖", layout="wide")
@@ -455,10 +461,195 @@ with st.sidebar:
    
        
     st.markdown("</div>", unsafe_allow_html=True)
+    # Filled in at the end of the script, after this run's result has been recorded
+    history_panel = st.container()
 
 # Backend URL - Make it configurable for different environments
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
+# Backend client settings: seconds to open a connection, seconds to wait for
+# the backend between bytes (for streams, between chunks), connection
+# attempts, and pooled keep-alive connections per backend host
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", 5))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", 120))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", 3))
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", 10))
+
+@st.cache_resource
+def get_backend_session() -> requests.Session:
+    """
+    One pooled, keep-alive HTTP session shared by every rerun and user session,
+    so requests to the backend reuse open TCP/TLS connections.
+    Only failed connection attempts are retried: nothing reached the backend,
+    so even a POST is safe to repeat. Dropped reads and error statuses are not.
+    """
+    retry = Retry(
+        total=BACKEND_RETRIES,
+        connect=BACKEND_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=0.5,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BACKEND_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def backend_timeout(read: float = BACKEND_READ_TIMEOUT) -> tuple:
+    """(connect, read) timeout for a backend request"""
+    return (BACKEND_CONNECT_TIMEOUT, read)
+
+# Results are cached in the frontend for FRONTEND_CACHE_TTL seconds (up to
+# FRONTEND_CACHE_MAX_ENTRIES per kind), and each session keeps its last
+# HISTORY_SIZE results, so reruns and revisits do not call the backend again
+FRONTEND_CACHE_TTL = float(os.getenv("FRONTEND_CACHE_TTL", 3600))
+FRONTEND_CACHE_MAX_ENTRIES = int(os.getenv("FRONTEND_CACHE_MAX_ENTRIES", 500))
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", 20))
+
+class BackendError(Exception):
+    """The backend answered with an error status"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class ResultCache:
+    """Thread-safe TTL cache shared by all sessions, for streamed results st.cache_data cannot capture"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key: tuple, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop the entry closest to expiry
+                self._entries.pop(min(self._entries, key=lambda k: self._entries[k][0]))
+            self._entries[key] = (time.time() + self.ttl, value)
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    return ResultCache(FRONTEND_CACHE_TTL, FRONTEND_CACHE_MAX_ENTRIES)
+
+def response_cache_key(query: str, style: str) -> tuple:
+    """Cache key for a tutor answer; case and whitespace do not matter, as in the backend cache"""
+    return ("response", " ".join(query.lower().split()), style)
+
+def quiz_cache_key(topic: str, difficulty: str, num_questions: int) -> tuple:
+    return ("quiz", topic, difficulty, num_questions)
+
+def remember_result(kind: str, title: str, **result):
+    """Make a result this page's current one and add it to the session history"""
+    entry = {"kind": kind, "title": title, "time": time.strftime("%H:%M"), **result}
+    st.session_state[f"last_{kind}"] = entry
+    history = [item for item in st.session_state.get("history", [])
+               if not (item["kind"] == kind and item["title"] == title and item.get("style") == result.get("style"))]
+    st.session_state.history = [entry] + history[:HISTORY_SIZE - 1]
+
+def open_history_entry(index: int):
+    """History button callback: show the entry on its page (runs before the page is rebuilt)"""
+    entry = st.session_state.history[index]
+    st.session_state[f"last_{entry['kind']}"] = entry
+    st.session_state.navigation = "AI Tutor" if entry["kind"] == "response" else "Quiz Generator"
+
+def clear_history():
+    """Forget this session's history; the result cache is shared by all sessions and is left alone"""
+    st.session_state.history = []
+    st.session_state.pop("last_response", None)
+    st.session_state.pop("last_quiz", None)
+
+def show_response(text: str, placeholder=None):
+    """Render a (possibly partial) tutor answer"""
+    (placeholder or st).markdown(f"<div class='full-width-response'><h3>🤖 AI Response:</h3><p>{text}</p></div>", unsafe_allow_html=True)
+
+def quiz_card_html(number: int, question: Dict) -> str:
+    """
+    One complete question card. All model-generated text is escaped here, and
+    only here, before it is put into HTML.
+    """
+    parts = [f"<div class='question-card'><h4>❓ Question {number}: {html.escape(str(question.get('question', '')))}</h4>"]
+    if question.get('options'):
+        options = "".join(
+            f"<div><b>{chr(letter)}.</b> {html.escape(str(option))}</div>"
+            for letter, option in enumerate(question['options'], ord('A'))
+        )
+        parts.append(f"<div class='options-list'>{options}</div>")
+    if question.get('correct_answer'):
+        parts.append(f"<div class='correct-answer'><b>✅ Correct Answer:</b> {html.escape(str(question['correct_answer']))}</div>")
+    if question.get('explanation'):
+        parts.append(f"<div class='explanation'><b>📘 Explanation:</b> {html.escape(str(question['explanation']))}</div>")
+    parts.append("</div>")
+    return "".join(parts)
+
+def render_quiz_cards(container, questions: List[Dict], first_number: int = 1):
+    """Append question cards to the container, one element per card, leaving earlier cards untouched"""
+    for number, question in enumerate(questions, first_number):
+        container.markdown(quiz_card_html(number, question), unsafe_allow_html=True)
+
+def quiz_header_html(count: int) -> str:
+    return f"<div class='card'><h3>📋 Generated Quiz ({count} questions)</h3></div>"
+
+def show_quiz(questions: List[Dict]):
+    """Render a complete quiz"""
+    st.markdown(quiz_header_html(len(questions)), unsafe_allow_html=True)
+    render_quiz_cards(st, questions)
+
+# Hint the backend to prefetch the quiz the user is configuring, so that
+# "Generate Quiz" is usually served from the quiz bank
+QUIZ_PREFETCH_ENABLED = os.getenv("QUIZ_PREFETCH_ENABLED", "true").lower() == "true"
+
+def send_prefetch_hint(topic: str, difficulty: str, num_questions: int):
+    """
+    Tell the backend which quiz this session is likely to request, once per
+    settled selection. Sent from a background thread, so the page never waits
+    on it; failures are ignored because the hint is only an optimization.
+    """
+    hint = (topic, difficulty, num_questions)
+    if not QUIZ_PREFETCH_ENABLED or st.session_state.get("prefetch_hint") == hint:
+        return
+    st.session_state.prefetch_hint = hint
+    payload = {"topic": topic, "difficulty": difficulty, "num_questions": num_questions,
+               "client_id": st.session_state.setdefault("client_id", uuid.uuid4().hex)}
+    # Streamlit APIs need the script thread, so look the session up here
+    session = get_backend_session()
+    
+    def send():
+        try:
+            session.post(f"{BACKEND_URL}/prefetch/quiz", json=payload, timeout=backend_timeout(5))
+        except requests.exceptions.RequestException:
+            pass
+    
+    threading.Thread(target=send, daemon=True).start()
+
+def stream_backend(path: str, payload: Dict):
+    """
+    POST to a streaming backend endpoint and yield its NDJSON messages.
+    Raises BackendError for an error status or an error line in the stream.
+    """
+    with get_backend_session().post(f"{BACKEND_URL}{path}", json=payload, stream=True,
+                                    timeout=backend_timeout()) as response:
+        if response.status_code != 200:
+            raise BackendError(response.status_code, response.text, response.headers.get("Retry-After"))
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            message = json.loads(line)
+            if "error" in message:
+                raise BackendError(500, message["error"])
+            yield message
+
 # AI Tutor Page
 if page == "AI Tutor":
     st.markdown("<h2 class='section-header'>🧠 AI Tutor</h2>", unsafe_allow_html=True)
@@ -481,66 +672,72 @@ if page == "AI Tutor":
                                 }[x])
         with col2:
             st.markdown("<div style='margin-top: 1.8rem;'></div>", unsafe_allow_html=True)
-            if st.button("🚀 Generate Response"):
-                if not user_query.strip():
-                    st.error("Please enter a question or topic.")
-                else:
-                    try:
-                        # Show a loading message with more detailed information
-                        with st.spinner("🧠 AI is thinking..."):
-                            # Make API call to backend with increased timeout
-                            response = requests.post(
-                                f"{BACKEND_URL}/generate_response",
-                                json={"query": user_query, "style": style},
-                                timeout=120  # Increased timeout to 120 seconds
-                            )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            # Store the response in session state
-                            st.session_state.ai_response = result['response']
-                        elif response.status_code == 429:
-                            st.error("""
-                            ⚠️ **Quota Limit Reached**: Your Google Gemini account has exceeded its current quota.
-                            
-                            **Solutions:**
-                            1. Wait a few minutes and try again
-                            2. Check your Google Cloud Console for quota usage
-                            3. Consider upgrading your plan for higher quotas
-                            """)
-                        else:
-                            st.error(f"❌ Backend Error ({response.status_code}): {response.text}")
-                            
-                    except requests.exceptions.Timeout:
-                        st.error("""
-                        ⏱️ **Request timed out (120 seconds exceeded)**
-                        
-                        This might be due to:
-                        - High demand on the AI model
-                        - Complex query requiring more processing time
-                        - Network connectivity issues
-                        
-                        **Please try again with a simpler query or wait a few minutes before retrying.**
-                        """)
-                    except requests.exceptions.ConnectionError:
-                        st.error("""
-                        🔌 **Could not connect to the backend server**
-                        
-                        Please make sure the application is running.
-                        Run 'python run_app.py' in your terminal to start the application.
-                        """)
-                        st.error(f"Expected backend URL: {BACKEND_URL}")
-                    except Exception as e:
-                        st.error(f"❌ An unexpected error occurred: {str(e)}")
-                        st.info("💡 Tip: Try a shorter or simpler query for faster response times.")
+            generate_clicked = st.button("🚀 Generate Response")
         st.markdown("</div>", unsafe_allow_html=True)
     
-    # Display AI response outside the container if available
-    if 'ai_response' in st.session_state and st.session_state.ai_response:
-        st.markdown(f"<div class='full-width-response'><h3>🤖 AI Response:</h3><p>{st.session_state.ai_response}</p></div>", unsafe_allow_html=True)
-        # Clear the response after displaying it
-        st.session_state.ai_response = None
-        st.markdown("</div>", unsafe_allow_html=True)
+    # Stream the AI response below the input card as it is generated
+    if generate_clicked:
+        if not user_query.strip():
+            st.error("Please enter a question or topic.")
+        elif get_result_cache().get(response_cache_key(user_query, style)) is not None:
+            ai_response = get_result_cache().get(response_cache_key(user_query, style))
+            remember_result("response", user_query.strip(), style=style, text=ai_response)
+            show_response(ai_response)
+        else:
+            response_placeholder = st.empty()
+            try:
+                ai_response = ""
+                with st.spinner("🧠 AI is thinking..."):
+                    # The read timeout applies between chunks, not to the whole answer
+                    for message in stream_backend("/generate_response/stream", {"query": user_query, "style": style}):
+                        if "chunk" in message:
+                            ai_response += message["chunk"]
+                            show_response(ai_response, response_placeholder)
+                if ai_response:
+                    get_result_cache().set(response_cache_key(user_query, style), ai_response)
+                    remember_result("response", user_query.strip(), style=style, text=ai_response)
+                    
+            except BackendError as e:
+                status_code = e.status_code
+                if status_code == 429:
+                    st.error(f"""
+                    ⚠️ **Quota Limit Reached**: Your Google Gemini account has exceeded its current quota.
+                    
+                    **Solutions:**
+                    1. Wait {e.retry_after or 'a few'} seconds and try again
+                    2. Check your Google Cloud Console for quota usage
+                    3. Consider upgrading your plan for higher quotas
+                    """)
+                elif status_code == 503:
+                    st.warning(f"⏳ **The tutor is busy right now.** Please try again in {e.retry_after or 'a few'} seconds.")
+                else:
+                    st.error(f"❌ Backend Error ({status_code}): {e}")
+                    
+            except requests.exceptions.Timeout:
+                st.error(f"""
+                ⏱️ **Request timed out ({BACKEND_READ_TIMEOUT:.0f} seconds without a reply)**
+                
+                This might be due to:
+                - High demand on the AI model
+                - Complex query requiring more processing time
+                - Network connectivity issues
+                
+                **Please try again with a simpler query or wait a few minutes before retrying.**
+                """)
+            except requests.exceptions.ConnectionError:
+                st.error("""
+                🔌 **Could not connect to the backend server**
+                
+                Please make sure the application is running.
+                Run 'python run_app.py' in your terminal to start the application.
+                """)
+                st.error(f"Expected backend URL: {BACKEND_URL}")
+            except Exception as e:
+                st.error(f"❌ An unexpected error occurred: {str(e)}")
+                st.info("💡 Tip: Try a shorter or simpler query for faster response times.")
+    elif "last_response" in st.session_state:
+        # Keep showing the last answer across reruns and page switches
+        show_response(st.session_state.last_response["text"])
 
 # Quiz Generator Page
 elif page == "Quiz Generator":
@@ -557,65 +754,55 @@ elif page == "Quiz Generator":
         selected_difficulty = st.selectbox("Select difficulty:", difficulties)
         
         # Number of questions
-        num_questions = st.slider("Number of questions:", min_value=1, max_value=10, value=5)
+        num_questions = st.slider("Number of questions:", min_value=1, max_value=20, value=5)
+        
+        # Every widget change reruns the page, so by now the selection has settled
+        send_prefetch_hint(selected_topic, selected_difficulty, num_questions)
         
         # Generate button
         if st.button("🎯 Generate Quiz"):
+            cache_key = quiz_cache_key(selected_topic, selected_difficulty, num_questions)
             try:
-                # Show a loading message with more detailed information
-                with st.spinner("🧠 Generating quiz questions..."):
-                    # Make API call to backend with increased timeout
-                    response = requests.post(
-                        f"{BACKEND_URL}/generate_quiz",
-                        json={
+                questions = get_result_cache().get(cache_key)
+                if questions is not None:
+                    show_quiz(questions)
+                else:
+                    # Stream the quiz and add each batch of cards as it arrives
+                    quiz_header = st.empty()
+                    cards = st.container()
+                    questions = []
+                    with st.spinner("🧠 Generating quiz questions..."):
+                        for message in stream_backend("/generate_quiz/stream", {
                             "topic": selected_topic,
                             "difficulty": selected_difficulty,
                             "num_questions": num_questions
-                        },
-                        timeout=120  # Increased timeout to 120 seconds
-                    )
+                        }):
+                            batch = message.get("questions", [])
+                            render_quiz_cards(cards, batch, len(questions) + 1)
+                            questions.extend(batch)
+                            quiz_header.markdown(quiz_header_html(len(questions)), unsafe_allow_html=True)
+                    get_result_cache().set(cache_key, questions)
+                remember_result("quiz", f"{selected_topic} · {selected_difficulty} · {num_questions}", questions=questions)
                 
-                if response.status_code == 200:
-                    questions = response.json()["questions"]
-                    
-                    # Display quiz
-                    st.markdown(f"<div class='card'><h3>📋 Generated Quiz ({len(questions)} questions)</h3></div>", unsafe_allow_html=True)
-                    
-                    for i, question in enumerate(questions, 1):
-                        st.markdown(f"""
-                        <div class='question-card'>
-                            <h4>❓ Question {i}: {question.get('question', '')}</h4>
-                        """, unsafe_allow_html=True)
-                        
-                        if 'options' in question and question['options']:
-                            st.markdown("<div class='options-list'>", unsafe_allow_html=True)
-                            for j, option in enumerate(question['options'], ord('A')):
-                                st.write(f"**{chr(j)}.** {option}")
-                            st.markdown("</div>", unsafe_allow_html=True)
-                        
-                        if 'correct_answer' in question and question['correct_answer']:
-                            st.markdown(f"<div class='correct-answer'><b>✅ Correct Answer:</b> {question['correct_answer']}</div>", unsafe_allow_html=True)
-                        
-                        if 'explanation' in question and question['explanation']:
-                            st.markdown(f"<div class='explanation'><b>📘 Explanation:</b> {question['explanation']}</div>", unsafe_allow_html=True)
-                        
-                        st.markdown("</div>", unsafe_allow_html=True)
-                        
-                elif response.status_code == 429:
-                    st.error("""
+            except BackendError as e:
+                status_code = e.status_code
+                if status_code == 429:
+                    st.error(f"""
                     ⚠️ **Quota Limit Reached**: Your Google Gemini account has exceeded its current quota.
                     
                     **Solutions:**
-                    1. Wait a few minutes and try again
+                    1. Wait {e.retry_after or 'a few'} seconds and try again
                     2. Check your Google Cloud Console for quota usage
                     3. Consider upgrading your plan for higher quotas
                     """)
+                elif status_code == 503:
+                    st.warning(f"⏳ **The tutor is busy right now.** Please try again in {e.retry_after or 'a few'} seconds.")
                 else:
-                    st.error(f"❌ Backend Error ({response.status_code}): {response.text}")
+                    st.error(f"❌ Backend Error ({status_code}): {e}")
                     
             except requests.exceptions.Timeout:
                 st.error("""
-                ⏱️ **Request timed out (120 seconds exceeded)**
+                ⏱️ **Quiz generation timed out**
                 
                 This might be due to:
                 - High demand on the AI model
@@ -635,7 +822,22 @@ elif page == "Quiz Generator":
             except Exception as e:
                 st.error(f"❌ An unexpected error occurred: {str(e)}")
                 st.info("💡 Tip: Try generating fewer questions for faster response times.")
+        elif "last_quiz" in st.session_state:
+            # Keep showing the last quiz across reruns and page switches
+            show_quiz(st.session_state.last_quiz["questions"])
         st.markdown("</div>", unsafe_allow_html=True)
 
+# Session history: reopen earlier answers and quizzes without calling the backend
+with history_panel:
+    history = st.session_state.get("history", [])
+    if history:
+        with st.expander(f"🕘 History ({len(history)})", expanded=False):
+            for index, entry in enumerate(history):
+                icon = "🧠" if entry["kind"] == "response" else "📝"
+                title = entry["title"] if len(entry["title"]) <= 40 else entry["title"][:37] + "..."
+                st.button(f"{icon} {title} · {entry['time']}", key=f"history_{index}",
+                          on_click=open_history_entry, args=(index,))
+            st.button("🗑️ Clear history", key="clear_history", on_click=clear_history)
+
 # Footer
 st.markdown("<div class='footer'>🤖 Agentic AI Tutor | Powered by Google Gemini | v1.0</div>", unsafe_allow_html=True)
\ No newline at end of file